@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import threading
+
+# SUMO picks the state format from the file suffix, binary states are the cheapest to write and re-load
+CHECKPOINT_FORMATS = {"xml": ".xml", "xml.gz": ".xml.gz", "binary": ".sbx"}
+
+# Shared memory is a tmpfs on Linux, so checkpoints never touch the disk
+_SHM_ROOT = "/dev/shm"
+
+
+def default_checkpoint_root():
+    """Directory for checkpoints: tmpfs when available, the system temp directory otherwise."""
+    if os.path.isdir(_SHM_ROOT) and os.access(_SHM_ROOT, os.W_OK):
+        return os.path.join(_SHM_ROOT, "dlisa_checkpoints")
+    return os.path.join(tempfile.gettempdir(), "dlisa_checkpoints")
+
+
+def split_state_path(path):
+    """Splits a checkpoint path into (stem, suffix), the suffix being one of CHECKPOINT_FORMATS."""
+    for suffix in sorted(CHECKPOINT_FORMATS.values(), key=len, reverse=True):
+        if path.endswith(suffix):
+            return path[:-len(suffix)], suffix
+    return os.path.splitext(path)
+
+
+class CheckpointStore:
+    """
+    Named SUMO state snapshots kept on tmpfs.
+
+    Every adaptation gets its own name, so concurrent adaptations never overwrite each other's
+    checkpoint. The local twins of a pool share one store: the live simulation saves its state once
+    and every local twin restores from that same file (remote twins get the bytes shipped instead).
+    """
+
+    def __init__(self, root=None, state_format="binary"):
+        if state_format not in CHECKPOINT_FORMATS:
+            raise ValueError(f"Unknown checkpoint format: {state_format}")
+
+        self.root = root if root is not None else default_checkpoint_root()
+        self.state_format = state_format
+        self.suffix = CHECKPOINT_FORMATS[state_format]
+        os.makedirs(self.root, exist_ok=True)
+
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.root, name + self.suffix)
+
+    def save(self, adapter, name):
+        """Saves the adapter's current state under name and returns its path."""
+        path = self.path(name)
+        adapter.save_checkpoint(path)
+
+        with self._lock:
+            self._names.add(name)
+        return path
+
+    def release(self, name):
+        """Removes a snapshot together with the states derived from it (suspended candidates, replicates)."""
+        with self._lock:
+            self._names.discard(name)
+
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.join(self.root, f"{name}_derived"), ignore_errors=True)
+
+    def close(self):
+        with self._lock:
+            names = list(self._names)
+        for name in names:
+            self.release(name)
@@ -0,0 +1,166 @@
+import argparse
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import threading
+
+# Snapshots are framed with their length, so several can share one stream
+_LENGTH = struct.Struct("!Q")
+
+# Requests: one op byte, the framed path, and the framed state bytes for a put
+_PUT = b"P"
+_GET = b"G"
+_REMOVE = b"R"
+_MAKEDIRS = b"M"
+_OK = b"\x00"
+_ERROR = b"\x01"
+
+
+def send_state(sock, data):
+    """Sends one state snapshot (bytes from SumoAdapter.export_state) over a connected socket."""
+    sock.sendall(_LENGTH.pack(len(data)))
+    sock.sendall(data)
+
+
+def recv_state(sock):
+    """Receives one snapshot sent with send_state, to be handed to SumoAdapter.import_state."""
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError(f"State stream closed after {received} of {size} bytes")
+        received += n
+    return bytes(buffer)
+
+
+class StateChannel:
+    """
+    Client of a state server (serve_states) running next to a SUMO instance on another host.
+
+    SUMO only loads and saves states as files on its own host, the channel moves the bytes of
+    those files: put() writes a snapshot where the remote SUMO can load it, get() reads back a
+    state it saved. Paths are absolute paths on the remote host, below `root`.
+    """
+
+    def __init__(self, host, port, root):
+        self.host = host
+        self.port = port
+        self.root = root
+        self._sock = None
+        # One request at a time on the shared connection
+        self._lock = threading.Lock()
+
+    def _request(self, op, path, data=None):
+        with self._lock:
+            if self._sock is None:
+                self._sock = socket.create_connection((self.host, self.port))
+            try:
+                self._sock.sendall(op)
+                send_state(self._sock, path.encode())
+                if data is not None:
+                    send_state(self._sock, data)
+                status = _recv_exact(self._sock, 1)
+                reply = recv_state(self._sock)
+            except OSError:
+                # The stream is out of sync after a failed request, the next one reconnects
+                self.close()
+                raise
+        if status != _OK:
+            raise OSError(f"State server {self.host}:{self.port}: {reply.decode()}")
+        return reply
+
+    def put(self, path, data):
+        self._request(_PUT, path, data)
+
+    def get(self, path):
+        return self._request(_GET, path)
+
+    def remove(self, path):
+        """Removes a state file or a directory of derived states."""
+        self._request(_REMOVE, path)
+
+    def makedirs(self, path):
+        self._request(_MAKEDIRS, path)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+
+class _StateRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        root = self.server.root
+        while True:
+            try:
+                op = _recv_exact(self.request, 1)
+            except ConnectionError:
+                return
+            path = recv_state(self.request).decode()
+            data = recv_state(self.request) if op == _PUT else None
+
+            try:
+                reply = self._apply(root, op, path, data)
+            except OSError as e:
+                self.request.sendall(_ERROR)
+                send_state(self.request, str(e).encode())
+            else:
+                self.request.sendall(_OK)
+                send_state(self.request, reply)
+
+    @staticmethod
+    def _apply(root, op, path, data):
+        path = os.path.realpath(path)
+        if os.path.commonpath([root, path]) != root:
+            raise PermissionError(f"{path} is outside {root}")
+
+        if op == _PUT:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        elif op == _GET:
+            with open(path, "rb") as f:
+                return f.read()
+        elif op == _REMOVE:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        elif op == _MAKEDIRS:
+            os.makedirs(path, exist_ok=True)
+        else:
+            raise OSError(f"Unknown state request {op!r}")
+        return b""
+
+
+def serve_states(port, root, host=""):
+    """Serves state files below root to StateChannel clients until interrupted."""
+    root = os.path.realpath(root)
+    os.makedirs(root, exist_ok=True)
+
+    server = socketserver.ThreadingTCPServer((host, port), _StateRequestHandler)
+    server.daemon_threads = True
+    server.root = root
+    print(f"[State] Serving {root} on port {port}")
+    with server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    # Run on every remote twin host, next to a SUMO started with --remote-port
+    parser = argparse.ArgumentParser(description="State server for remote Cyber-Twin SUMO instances")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--root", default="/dev/shm/dlisa_checkpoints")
+    args = parser.parse_args()
+    serve_states(args.port, args.root)
@@ -1,81 +1,219 @@
 import os
+import shutil
+import threading
+
 import traci
+from traci import constants as tc
+
+from adapters.checkpoint_store import CHECKPOINT_FORMATS, default_checkpoint_root
+from adapters.waiting_meter import WaitingTimeMeter
+
+# libsumo is optional, it is only needed for the in-process backend
+try:
+    import libsumo
+except ImportError:
+    libsumo = None
+
+BACKENDS = ("traci", "libsumo")
+
+# Incoming lanes of the intersection, in get_state order: NS Axis (B2, B4), EW Axis (B1, B3)
+INCOMING_LANES = ("B2A1_0", "B4A1_0", "B1A1_0", "B3A1_0")
+LANE_VARIABLES = (tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.LAST_STEP_VEHICLE_NUMBER)
+
+# traci.start registers connections in a module-level table, keep it single-threaded
+_START_LOCK = threading.Lock()
+
+# libsumo runs SUMO inside this process, so only one simulation can be active at a time
+_LIBSUMO_OWNER = None
+
+_SUMO_ERRORS = (traci.exceptions.FatalTraCIError, traci.exceptions.TraCIException, OSError)
+if libsumo is not None:
+    _SUMO_ERRORS += (libsumo.TraCIException,)
 
 
 class SumoAdapter:
-    def __init__(self, gui=False, label="default", port=None):
+    def __init__(self, gui=False, label="default", port=None, backend="traci", waiting_mode="vehicle", save_rng=False,
+                 delay=None, route_file=None, end=None, host=None, state_channel=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown SUMO backend: {backend}")
+        if backend == "libsumo" and gui:
+            raise ValueError("The libsumo backend is headless only, use backend='traci' with gui=True")
+        if host is not None and (backend != "traci" or state_channel is None):
+            raise ValueError("A remote SUMO needs the traci backend and a state channel to its host")
+
         self.sumo_binary = "sumo-gui" if gui else "sumo"
+        # sumo-gui delay per step in ms, None runs as fast as possible
+        self.delay = delay
+        # Overrides of the config's route file (e.g. a gzip-compressed one) and end time, None keeps the config's
+        self.route_file = route_file
+        self.end = end
+        self.backend = backend
         self.config_path = "traffic_env/config.sumocfg"
         self.tls_id = "A1"
         self.label = label
         self.port = port
         self.conn = None
+        self.seed = None
+        self.restarts = 0
+        self.step_length = 1.0
+        # Saved states include the RNG states, so restoring them replays the same random stream
+        self.save_rng = save_rng
+        # Remote SUMO: started on `host` with --remote-port (same checkout layout), state files are moved
+        # through the state channel (adapters.state_transfer) since they live on that host
+        self.host = host
+        self.state_channel = state_channel
 
-        #  last cumm time
-        self._prev_wait = {}
+        self.waiting_meter = WaitingTimeMeter(waiting_mode)
 
-    def start(self, seed=None):
-        cmd = [self.sumo_binary, "-c", self.config_path, "--start", "--delay", "1", "--quit-on-end"]
+    def _command(self, seed=None):
+        cmd = [self.sumo_binary, "-c", self.config_path, "--start", "--quit-on-end"]
 
+        if self.delay is not None:
+            cmd += ["--delay", str(self.delay)]
+        if self.route_file is not None:
+            cmd += ["--route-files", self.route_file]
+        if self.end is not None:
+            cmd += ["--end", str(self.end)]
+        if self.save_rng:
+            cmd += ["--save-state.rng"]
         if seed is not None:
             cmd += ["--seed", str(seed)]
+        return cmd
+
+    def start(self, seed=None):
+        cmd = self._command(seed)
+        self.seed = seed
 
-        traci.start(cmd, label=self.label, port=self.port)
-        self.conn = traci.getConnection(self.label)
+        if self.backend == "libsumo":
+            self._start_libsumo(cmd)
+            return
+
+        if not self.is_local:
+            # The remote SUMO is already running, the command line is applied by reloading it
+            self.conn = traci.connect(port=self.port, host=self.host)
+            self.reseed(seed)
+            return
+
+        with _START_LOCK:
+            traci.start(cmd, label=self._connection_label(), port=self.port)
+            self.conn = traci.getConnection(self._connection_label())
+        self._subscribe()
+
+    def _start_libsumo(self, cmd):
+        global _LIBSUMO_OWNER
+
+        if libsumo is None:
+            raise ImportError("The libsumo backend requires the 'libsumo' package (shipped with SUMO)")
+
+        with _START_LOCK:
+            if _LIBSUMO_OWNER is not None and _LIBSUMO_OWNER is not self:
+                raise RuntimeError(f"libsumo simulation already owned by '{_LIBSUMO_OWNER.label}'")
+            libsumo.start(cmd)
+            _LIBSUMO_OWNER = self
+
+        # The libsumo module exposes the same domains (lane, vehicle, simulation, ...) as a TraCI connection
+        self.conn = libsumo
+        self._subscribe()
 
     def close(self):
+        global _LIBSUMO_OWNER
+
+        if self.state_channel is not None:
+            self.state_channel.close()
         if self.conn is not None:
-            self.conn.close()
-            self.conn = None
+            try:
+                self.conn.close()
+            finally:
+                self.conn = None
+                if _LIBSUMO_OWNER is self:
+                    _LIBSUMO_OWNER = None
 
-    def get_state(self):
+    @property
+    def is_local(self):
+        """True if SUMO runs on this host and shares its filesystem."""
+        return self.host is None
+
+    def _connection_label(self):
+        # A crashed connection may still be registered under the old label, so restarts get a fresh one
+        return self.label if self.restarts == 0 else f"{self.label}_r{self.restarts}"
+
+    def is_alive(self):
+        """Health check: True if the SUMO process still answers TraCI requests."""
+        if self.conn is None:
+            return False
+        try:
+            self.conn.simulation.getTime()
+        except _SUMO_ERRORS:
+            return False
+        return True
+
+    def restart(self):
+        """
+        Drop the (possibly dead) connection and spawn a fresh SUMO process with the same seed.
+        A remote SUMO is only reconnected, it has to be restarted on its host.
+        """
+        try:
+            self.close()
+        except _SUMO_ERRORS:
+            pass
+        self.restarts += 1
+        self.start(seed=self.seed)
+
+    def reseed(self, seed):
+        """
+        Reloads the simulation on the open connection with a new seed. A checkpoint loaded afterwards
+        continues on the freshly seeded RNG, unless it carries RNG states itself.
+        """
+        self.conn.load(self._command(seed)[1:])
+        self.seed = seed
+        self.waiting_meter.reset()
+        self._subscribe()
+
+    def _subscribe(self):
+        """
+        Subscribes to everything the per-step queries need, so SUMO pushes all values
+        in the single simulationStep response instead of one round-trip per value.
+        """
+        for lane_id in INCOMING_LANES:
+            self.conn.lane.subscribe(lane_id, list(LANE_VARIABLES))
+
+        # Newly departed vehicles get their own waiting time subscription in run_step,
+        # arrived vehicles are dropped from the waiting meter
+        self.conn.simulation.subscribe([tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS])
+        self.step_length = self.conn.simulation.getDeltaT()
+        if self.waiting_meter.needs_vehicle_data:
+            for vid in self.conn.vehicle.getIDList():
+                self._subscribe_vehicle(vid)
 
-        # NS Axis (B2, B4)
-        h_NS1 = self.conn.lane.getLastStepHaltingNumber("B2A1_0")
-        h_NS2 = self.conn.lane.getLastStepHaltingNumber("B4A1_0")
-        t_NS1 = self.conn.lane.getLastStepVehicleNumber("B2A1_0")
-        t_NS2 = self.conn.lane.getLastStepVehicleNumber("B4A1_0")
+    def _subscribe_vehicle(self, vid):
+        self.conn.vehicle.subscribe(vid, [tc.VAR_ACCUMULATED_WAITING_TIME])
 
-        # EW Axis (B1, B3)
-        h_EW1 = self.conn.lane.getLastStepHaltingNumber("B1A1_0")
-        h_EW2 = self.conn.lane.getLastStepHaltingNumber("B3A1_0")
-        t_EW1 = self.conn.lane.getLastStepVehicleNumber("B1A1_0")
-        t_EW2 = self.conn.lane.getLastStepVehicleNumber("B3A1_0")
+    def get_state(self):
+        lanes = self.conn.lane.getAllSubscriptionResults()
 
-        # Return as two distinct vectors
-        # Vector 1: Queue/Halting
-        halting_state = [h_NS1, h_NS2, h_EW1, h_EW2]
-        # Vector 2: Density/Total
-        density_state = [t_NS1, t_NS2, t_EW1, t_EW2]
+        # Vector 1: Queue/Halting - [NS1, NS2, EW1, EW2]
+        halting_state = [lanes[lane_id][tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for lane_id in INCOMING_LANES]
+        # Vector 2: Density/Total - [NS1, NS2, EW1, EW2]
+        density_state = [lanes[lane_id][tc.LAST_STEP_VEHICLE_NUMBER] for lane_id in INCOMING_LANES]
 
         return halting_state, density_state
 
     def reset_waiting_meter(self):
         """Reset delta-wait tracking (call at the start of each evaluation window)."""
-        self._prev_wait = {}
+        self.waiting_meter.reset()
 
     def get_delta_waiting_time_step(self) -> float:
         """
-        Return waiting time ADDED during the current step only (delta),
-        computed from accumulated waiting time differences per vehicle.
+        Return waiting time ADDED during the current step only (delta).
+        Depending on the meter mode it comes from per-vehicle accumulated waiting time
+        differences or from the halting counts on the incoming lanes.
         """
-        total_delta = 0.0
-        veh_ids = self.conn.vehicle.getIDList()
+        if self.waiting_meter.needs_vehicle_data:
+            # Only vehicles still in the simulation keep a subscription
+            return self.waiting_meter.vehicle_delta(self.conn.vehicle.getAllSubscriptionResults())
 
-        for vid in veh_ids:
-            cur = self.conn.vehicle.getAccumulatedWaitingTime(vid)
-            prev = self._prev_wait.get(vid, cur)  # first time seen -> delta 0
-            d = cur - prev
-            if d > 0:
-                total_delta += d
-            self._prev_wait[vid] = cur
-
-        # cleanup vehicles that left the simulation
-        for vid in list(self._prev_wait.keys()):
-            if vid not in veh_ids:
-                del self._prev_wait[vid]
-
-        return total_delta
+        halting_state, _ = self.get_state()
+        return self.waiting_meter.halting_delta(halting_state, self.step_length)
 
     def apply_configuration(self, green_NS, green_EW, log=True):
         #if log: print("APPLY green_NS:", green_NS, "green_EW:", green_EW)
@@ -100,14 +238,86 @@ class SumoAdapter:
         logic.phases = phases
         self.conn.trafficlight.setCompleteRedYellowGreenDefinition(self.tls_id, logic)
 
+    def cycle_length(self):
+        """Steps of one full signal cycle (greens and yellows) of the current program."""
+        logic = self.conn.trafficlight.getAllProgramLogics(self.tls_id)[0]
+        return int(round(sum(phase.duration for phase in logic.phases) / self.step_length))
+
     def save_checkpoint(self, path: str):
-        """Save SUMO state to an XML checkpoint."""
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        """Save SUMO state to a checkpoint, the suffix picks the format (.xml, .xml.gz or binary .sbx)."""
+        if self.is_local:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        else:
+            self.state_channel.makedirs(os.path.dirname(path))
         self.conn.simulation.saveState(path)
 
     def load_checkpoint(self, path: str):
-        """Load SUMO state from an XML checkpoint."""
+        """Load SUMO state from a checkpoint (.xml, .xml.gz or binary .sbx)."""
         self.conn.simulation.loadState(path)
+        # The loaded vehicles replace the old ones (and their subscriptions)
+        self.waiting_meter.reset()
+        self._subscribe()
+
+    @property
+    def state_root(self):
+        """Directory for state files on SUMO's host."""
+        return default_checkpoint_root() if self.is_local else self.state_channel.root
+
+    def store_state(self, data, path):
+        """Writes state bytes to path on SUMO's host, where load_checkpoint can read them."""
+        if self.is_local:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        else:
+            self.state_channel.put(path, data)
+
+    def fetch_state(self, path):
+        """Reads the bytes of a state file on SUMO's host."""
+        if self.is_local:
+            with open(path, "rb") as f:
+                return f.read()
+        return self.state_channel.get(path)
+
+    def remove_state(self, path):
+        """Removes a state file, or a directory of states, on SUMO's host."""
+        if not self.is_local:
+            self.state_channel.remove(path)
+        elif os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def export_state(self, state_format="binary"):
+        """
+        Snapshot of the current state as bytes, to be imported by a SUMO on another host.
+        SUMO only writes states to files, the scratch file is removed right away.
+        """
+        path = os.path.join(self.state_root,
+                            f"export_{self._connection_label()}_{os.getpid()}{CHECKPOINT_FORMATS[state_format]}")
+        self.save_checkpoint(path)
+        try:
+            return self.fetch_state(path)
+        finally:
+            self.remove_state(path)
+
+    def import_state(self, data, state_format="binary", path=None):
+        """
+        Stores a snapshot produced by export_state on SUMO's host (at path, or a file of this adapter
+        below state_root) and loads it. Returns the path, so the state can be reloaded later.
+        """
+        if path is None:
+            path = os.path.join(self.state_root, self.label,
+                                f"import_{os.getpid()}{CHECKPOINT_FORMATS[state_format]}")
+        self.store_state(data, path)
+        self.load_checkpoint(path)
+        return path
 
     def run_step(self):
         self.conn.simulationStep()
+
+        events = self.conn.simulation.getSubscriptionResults()
+        if self.waiting_meter.needs_vehicle_data:
+            for vid in events[tc.VAR_DEPARTED_VEHICLES_IDS]:
+                self._subscribe_vehicle(vid)
+        self.waiting_meter.on_arrived(events[tc.VAR_ARRIVED_VEHICLES_IDS])
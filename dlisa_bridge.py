@@ -1,5 +1,14 @@
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import numpy as np
 
+from adapters.checkpoint_store import CheckpointStore, split_state_path
+
 ###### Global definitions of configurable parameters
 ### Bounds
 LIGHTS_TIME_BOUNDS = [[15, 60], [15, 60]]
@@ -8,6 +17,20 @@ LIGHTS_TIME_BOUNDS = [[15, 60], [15, 60]]
 WARMUP_STEPS = 30
 MEASURE_STEPS = 100
 ###
+### Multi-fidelity (successive halving) evaluation
+# Cumulative measure steps at which candidates are ranked, the last rung is the full horizon
+MULTI_FIDELITY_RUNGS = [25, 50, MEASURE_STEPS]
+# Fraction of candidates that survives each rung
+MULTI_FIDELITY_KEEP = 0.5
+###
+### Replicated evaluation with common random numbers
+# Replicate r of every candidate restores the same checkpoint on a SUMO seeded with REPLICATE_BASE_SEED + r
+REPLICATE_BASE_SEED = 1000
+# Replicates every candidate gets before it may stop early
+EVALUATION_MIN_REPLICATES = 2
+# Normal quantile of the two-sided confidence interval that has to separate a candidate from the incumbent
+CONFIDENCE_Z = 1.96
+###
 ######
 
 
@@ -16,7 +39,7 @@ class SumoBridge:
     The interface between SUMO Simulation and the DLiSA Brain.
     """
 
-    def __init__(self, sumo_adapter):
+    def __init__(self, sumo_adapter, checkpoint_store=None):
         self.adapter = sumo_adapter
 
         # DLiSA needs to know the limits of the genes (knobs)
@@ -25,41 +48,588 @@ class SumoBridge:
         # [NS bounds, EW bounds]
         self.bounds = LIGHTS_TIME_BOUNDS
         self.checkpoint = None
+        # Store the live snapshots are saved to, a pool keeps one shared store for all its local twins instead
+        self.checkpoint_store = checkpoint_store
+        # Bytes of snapshots and suspended states shipped to this twin's host (remote twins only)
+        self.received_bytes = 0
 
-    def evaluate(self, configuration, log=True):
+        # Successive-halving evaluation in evaluate_batch
+        self.multi_fidelity = False
+        self.simulated_steps = 0
+
+        # Replicated evaluation in evaluate_batch: up to `replicates` seeded replicates per candidate.
+        # With common_random_numbers a single replicate is still seeded, so candidates see the same traffic.
+        self.replicates = 1
+        self.min_replicates = EVALUATION_MIN_REPLICATES
+        self.common_random_numbers = False
+        # (checkpoint, replicate) -> future of the seeded checkpoint path, shared by the local twins of a pool
+        self._replicate_checkpoints = {}
+        self._replicate_lock = threading.Lock()
+
+    def start(self, seed=None):
+        self.adapter.start(seed=seed)
+
+    def close(self):
+        self.adapter.close()
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.close()
+
+    def take_checkpoint(self, source_adapter, name):
         """
-        DLiSA calls this to test a specific configuration.
+        Saves the state of source_adapter (the live simulation) under name and evaluates from it
+        afterwards, a remote twin gets the state bytes shipped. Returns the checkpoint report (bytes, seconds).
         """
-        # Apply the configuration
+        started = time.perf_counter()
+        if self.checkpoint_store is None:
+            self.checkpoint_store = CheckpointStore()
+        if not self.adapter.is_local:
+            data = source_adapter.export_state(self.checkpoint_store.state_format)
+            self.receive_checkpoint(data, name, self.checkpoint_store.suffix)
+            return {"bytes": len(data), "seconds": time.perf_counter() - started}
+
+        self.checkpoint = self.checkpoint_store.save(source_adapter, name)
+        return {"bytes": os.path.getsize(self.checkpoint), "seconds": time.perf_counter() - started}
+
+    def release_checkpoint(self, name):
+        if self.checkpoint_store is None:
+            return
+        if not self.adapter.is_local:
+            self.release_received_checkpoint(name, self.checkpoint_store.suffix)
+            return
+        self.forget_checkpoint(self.checkpoint_store.path(name))
+        self.checkpoint_store.release(name)
+
+    def received_checkpoint_path(self, name, suffix):
+        """Where a checkpoint shipped to this twin lives on its host."""
+        return os.path.join(self.adapter.state_root, self.adapter.label, name + suffix)
+
+    def receive_checkpoint(self, data, name, suffix):
+        """
+        Stores snapshot bytes exported from the live simulation on this twin's host and evaluates
+        from them afterwards. Returns the transfer report (bytes, seconds).
+        """
+        started = time.perf_counter()
+        path = self.received_checkpoint_path(name, suffix)
+        self.adapter.store_state(data, path)
+        self.checkpoint = path
+        self.received_bytes += len(data)
+        return {"bytes": len(data), "seconds": time.perf_counter() - started}
+
+    def release_received_checkpoint(self, name, suffix):
+        path = self.received_checkpoint_path(name, suffix)
+        self.forget_checkpoint(path)
+        stem, _ = split_state_path(path)
+        self.adapter.remove_state(path)
+        self.adapter.remove_state(f"{stem}_derived")
+
+    def forget_checkpoint(self, path):
+        """Drops every reference to a checkpoint path and to the replicate states derived from it."""
+        if self.checkpoint == path:
+            self.checkpoint = None
+        with self._replicate_lock:
+            for key in [key for key in self._replicate_checkpoints if key[0] == path]:
+                del self._replicate_checkpoints[key]
+
+    def ensure_healthy(self):
+        """Restarts the twin SUMO process if it died. Returns True if a restart was needed."""
+        if self.adapter.is_alive():
+            return False
+        print(f"   [Twin] {self.adapter.label} is not responding, restarting")
+        self.adapter.restart()
+        return True
+
+    def clip_configuration(self, configuration):
         green_ns = int(configuration[0])
         green_ew = int(configuration[1])
 
         # Safety check: Ensure values are within bounds
         green_ns = max(self.bounds[0][0], min(self.bounds[0][1], green_ns))
         green_ew = max(self.bounds[1][0], min(self.bounds[1][1], green_ew))
+        return green_ns, green_ew
 
-        replicate_costs = []
+    def replicate_checkpoint(self, replicate):
+        """
+        The checkpoint as seen by a SUMO freshly seeded for the given replicate. It is saved once per
+        checkpoint with the RNG states included (twins run with save_rng), so every candidate
+        evaluated on this replicate restores exactly the same random stream.
 
-        # Load checkpoint for fresh evaluation
-        if self.checkpoint:
+        In a pool the first twin that needs a replicate derives it (reseeding reloads its SUMO), the
+        other twins wait for that replicate only and restore the saved state without reloading.
+        The lock only guards the map, the SUMO reload and save run outside of it.
+        """
+        key = (self.checkpoint, replicate)
+        with self._replicate_lock:
+            pending = self._replicate_checkpoints.get(key)
+            derive = pending is None
+            if derive:
+                pending = Future()
+                self._replicate_checkpoints[key] = pending
+        if not derive:
+            return pending.result()
+
+        try:
+            stem, suffix = split_state_path(self.checkpoint)
+            path = os.path.join(f"{stem}_derived", f"replicate_{replicate}{suffix}")
+            self.adapter.reseed(REPLICATE_BASE_SEED + replicate)
             self.adapter.load_checkpoint(self.checkpoint)
+            self.adapter.save_checkpoint(path)
+        except BaseException as e:
+            # The next twin that needs the replicate derives it again
+            with self._replicate_lock:
+                if self._replicate_checkpoints.get(key) is pending:
+                    del self._replicate_checkpoints[key]
+            pending.set_exception(e)
+            raise
+        pending.set_result(path)
+        return path
 
-            # Apply candidate
-            self.adapter.apply_configuration(green_ns, green_ew, log)
+    def start_candidate(self, green_ns, green_ew, log=True, replicate=None):
+        """Restores the checkpoint (of the given replicate), applies the candidate and runs the warm-up."""
+        checkpoint = self.checkpoint if replicate is None else self.replicate_checkpoint(replicate)
+        self.adapter.load_checkpoint(checkpoint)
 
-            # Warm-up
-            for _ in range(WARMUP_STEPS):
-                self.adapter.run_step()
+        # Apply candidate
+        self.adapter.apply_configuration(green_ns, green_ew, log)
+
+        # Warm-up
+        for _ in range(WARMUP_STEPS):
+            self.adapter.run_step()
+        self.simulated_steps += WARMUP_STEPS
+
+        self.adapter.reset_waiting_meter()
+
+    def evaluate(self, configuration, log=True):
+        """
+        DLiSA calls this to test a specific configuration.
+        """
+        if self.replicates > 1 or self.common_random_numbers:
+            return [replicated_evaluation(self, [configuration], log=log)[0]]
+
+        # Apply the configuration
+        green_ns, green_ew = self.clip_configuration(configuration)
+
+        replicate_costs = []
+
+        # Load checkpoint for fresh evaluation
+        if self.checkpoint:
+            self.start_candidate(green_ns, green_ew, log)
 
             # Measure delta waiting
-            self.adapter.reset_waiting_meter()
             cost = 0.0
             for _ in range(MEASURE_STEPS):
                 self.adapter.run_step()
                 cost += self.adapter.get_delta_waiting_time_step()
 
                 replicate_costs.append(cost)
+            self.simulated_steps += MEASURE_STEPS
 
         # Mean across replications
         mean_cost = float(np.mean(replicate_costs))
         return [mean_cost]
+
+    def measure(self, configuration, replicate=None, threshold=None, log=True):
+        """
+        Measures a candidate like evaluate (mean of the running cumulative cost), optionally on a seeded
+        replicate. With a threshold the run stops as soon as the cost provably exceeds it: the running
+        cost never decreases, so cost_area + cost * remaining_steps bounds the final cost area from below.
+
+        Returns (cost, censored), a censored cost is that lower bound.
+        """
+        green_ns, green_ew = self.clip_configuration(configuration)
+        self.start_candidate(green_ns, green_ew, log, replicate)
+
+        cost = 0.0
+        cost_area = 0.0
+        for step in range(1, MEASURE_STEPS + 1):
+            self.adapter.run_step()
+            cost += self.adapter.get_delta_waiting_time_step()
+            cost_area += cost
+
+            if threshold is not None and step < MEASURE_STEPS:
+                lower_bound = (cost_area + cost * (MEASURE_STEPS - step)) / MEASURE_STEPS
+                if lower_bound > threshold:
+                    self.simulated_steps += step
+                    return lower_bound, True
+        self.simulated_steps += MEASURE_STEPS
+
+        return cost_area / MEASURE_STEPS, False
+
+    def evaluate_replicate(self, configuration, replicate, log=True):
+        """Cost of one seeded replicate, measured like evaluate."""
+        return self.measure(configuration, replicate, log=log)[0]
+
+    def evaluate_segment(self, task, target_steps, suspend, log=True):
+        """
+        Measures a candidate up to target_steps, either from scratch or resuming the state saved
+        by a previous (shorter) segment. With suspend=True the reached state is saved again so a
+        later rung can extend it instead of restarting.
+
+        task: {"config", "steps", "cost", "cost_area", "state", "meter", "owner"}, a new dict is returned;
+        owner is the bridge that saved the state.
+        """
+        green_ns, green_ew = self.clip_configuration(task["config"])
+
+        if task["state"] is None:
+            self.start_candidate(green_ns, green_ew, log)
+        else:
+            state = task["state"]
+            owner = task["owner"]
+            if owner is not self and not (owner.adapter.is_local and self.adapter.is_local):
+                # The state was saved on another host, its bytes are shipped next to this twin's checkpoint
+                stem, _ = split_state_path(self.checkpoint)
+                data = owner.adapter.fetch_state(state)
+                state = os.path.join(f"{stem}_derived", "imported_" + os.path.basename(state))
+                self.adapter.store_state(data, state)
+                self.received_bytes += len(data)
+            # The candidate program is installed before the load, so the restored phase timing applies to it
+            self.adapter.apply_configuration(green_ns, green_ew, log)
+            self.adapter.load_checkpoint(state)
+            self.adapter.waiting_meter.restore(task["meter"])
+
+        cost = task["cost"]
+        cost_area = task["cost_area"]
+        for _ in range(target_steps - task["steps"]):
+            self.adapter.run_step()
+            cost += self.adapter.get_delta_waiting_time_step()
+            cost_area += cost
+        self.simulated_steps += target_steps - task["steps"]
+
+        state = None
+        meter = None
+        if suspend:
+            # Suspended states live next to (and in the format of) the checkpoint they started from, in the
+            # store shared by the local twins, so whichever twin is idle at the next rung can resume them
+            stem, suffix = split_state_path(self.checkpoint)
+            state = os.path.join(f"{stem}_derived", f"cand_{green_ns}_{green_ew}{suffix}")
+            self.adapter.save_checkpoint(state)
+            meter = self.adapter.waiting_meter.snapshot()
+
+        return {"config": task["config"], "steps": target_steps, "cost": cost, "cost_area": cost_area,
+                "state": state, "meter": meter, "owner": self if suspend else None}
+
+    def map(self, fn, items):
+        return [fn(self, item) for item in items]
+
+    def evaluate_batch(self, configurations, log=True, incumbent=None):
+        """
+        Evaluates several configurations one after the other, costs are returned in input order.
+        """
+        if self.multi_fidelity:
+            return successive_halving(self, configurations, log=log)[0]
+        if self.replicates > 1 or self.common_random_numbers:
+            return replicated_evaluation(self, configurations, incumbent=incumbent, log=log)
+        return [self.evaluate(configuration, log)[0] for configuration in configurations]
+
+    def measure_batch(self, configurations, log=True, incumbent=None):
+        return measure_batch(self, configurations, log, incumbent)
+
+    def race_batch(self, configurations, threshold, log=True, incumbent=None):
+        return race(self, configurations, threshold, log, incumbent)
+
+
+def measure_batch(bridge, configurations, log=True, incumbent=None):
+    """
+    Like evaluate_batch, but returns (costs, censored flags) in input order. Candidates pruned by
+    successive halving only got an extrapolated cost, so they are flagged like raced candidates.
+    """
+    if bridge.multi_fidelity:
+        return successive_halving(bridge, configurations, log=log)
+    return bridge.evaluate_batch(configurations, log, incumbent), [False] * len(configurations)
+
+
+def race(bridge, configurations, threshold, log=True, incumbent=None):
+    """
+    Evaluates candidates that only matter if they beat the threshold, each measurement stops as soon
+    as it provably cannot. Returns (costs, censored flags) in input order.
+
+    Racing needs a single measurement per candidate, with multi-fidelity or several replicates
+    the batch is measured normally (see measure_batch).
+    """
+    if bridge.multi_fidelity or bridge.replicates > 1:
+        return measure_batch(bridge, configurations, log, incumbent)
+
+    replicate = 0 if bridge.common_random_numbers else None
+    results = bridge.map(lambda twin, cfg: twin.measure(cfg, replicate, threshold, log), configurations)
+    costs = [cost for cost, _ in results]
+    censored = [is_censored for _, is_censored in results]
+
+    if log and any(censored):
+        print(f"     [Race] {sum(censored)}/{len(configurations)} candidates stopped above {threshold:.2f}")
+
+    return costs, censored
+
+
+def _separated(samples, incumbent):
+    """True if the confidence interval of the samples' mean excludes the incumbent cost."""
+    if len(samples) < 2:
+        return False
+    half_width = CONFIDENCE_Z * np.std(samples, ddof=1) / math.sqrt(len(samples))
+    return abs(np.mean(samples) - incumbent) > half_width
+
+
+def replicated_evaluation(bridge, configurations, replicates=None, min_replicates=None, incumbent=None, log=True):
+    """
+    Evaluates every candidate on seeded replicates with common random numbers: replicate r uses the
+    same seed for all candidates, so cost differences come from the configurations, not the traffic.
+
+    After min_replicates, a candidate only gets another replicate while the confidence interval of its
+    mean still overlaps the incumbent (the best mean so far, or the given incumbent cost if lower).
+    Each round of replicates runs in parallel on a pool. Costs (replicate means) are returned in input order.
+    """
+    replicates = bridge.replicates if replicates is None else replicates
+    min_replicates = bridge.min_replicates if min_replicates is None else min_replicates
+    min_replicates = max(1, min(min_replicates, replicates))
+
+    samples = [[] for _ in configurations]
+    pending = [(i, r) for i in range(len(configurations)) for r in range(min_replicates)]
+
+    while pending:
+        costs = bridge.map(lambda twin, task: twin.evaluate_replicate(configurations[task[0]], task[1], log), pending)
+        for (i, _), cost in zip(pending, costs):
+            samples[i].append(cost)
+
+        best = min(np.mean(candidate_samples) for candidate_samples in samples)
+        if incumbent is not None:
+            best = min(best, incumbent)
+
+        # Replicates are appended in order, so the next replicate index is the sample count
+        pending = [(i, len(candidate_samples)) for i, candidate_samples in enumerate(samples)
+                   if len(candidate_samples) < replicates and not _separated(candidate_samples, best)]
+
+    if log and replicates > 1:
+        simulated = sum(len(candidate_samples) for candidate_samples in samples)
+        print(f"     [CRN] {simulated}/{len(configurations) * replicates} replicates simulated "
+              f"for {len(configurations)} candidates")
+
+    return [float(np.mean(candidate_samples)) for candidate_samples in samples]
+
+
+def successive_halving(bridge, configurations, rungs=None, keep=None, log=True):
+    """
+    Multi-fidelity evaluation: all candidates run the first rung, the worst are pruned and the
+    survivors are resumed from their saved state up to the next rung, until the full horizon.
+
+    Survivors get exactly the cost evaluate() would return. Pruned candidates get their partial
+    cost extrapolated to the full horizon, but never less than the worst survivor, so truncation
+    selection keeps ranking them behind every fully measured candidate.
+
+    Returns (costs, censored flags) in input order, the pruned candidates are censored.
+    """
+    rungs = MULTI_FIDELITY_RUNGS if rungs is None else rungs
+    keep = MULTI_FIDELITY_KEEP if keep is None else keep
+    full_steps = rungs[-1]
+
+    tasks = [{"config": cfg, "steps": 0, "cost": 0.0, "cost_area": 0.0, "state": None, "meter": None,
+              "owner": None} for cfg in configurations]
+    alive = list(range(len(tasks)))
+    pruned = []
+
+    for r, target_steps in enumerate(rungs):
+        last_rung = r == len(rungs) - 1
+        results = bridge.map(lambda b, task: b.evaluate_segment(task, target_steps, not last_rung, log),
+                             [tasks[i] for i in alive])
+        for i, task in zip(alive, results):
+            tasks[i] = task
+
+        if last_rung:
+            break
+
+        # Rank on the same statistic evaluate() reports (mean of the running cumulative cost)
+        alive.sort(key=lambda i: tasks[i]["cost_area"] / tasks[i]["steps"])
+        n_keep = max(1, math.ceil(len(alive) * keep))
+        pruned += alive[n_keep:]
+        alive = alive[:n_keep]
+
+    costs = [0.0] * len(tasks)
+    for i in alive:
+        costs[i] = tasks[i]["cost_area"] / full_steps
+    worst_survivor = max(costs[i] for i in alive) if alive else 0.0
+
+    for i in pruned:
+        # A constant waiting rate makes the running cumulative cost grow linearly
+        steps = tasks[i]["steps"]
+        extrapolated = tasks[i]["cost_area"] / steps * (full_steps + 1) / (steps + 1)
+        costs[i] = max(extrapolated, worst_survivor)
+
+    if log:
+        simulated = sum(task["steps"] for task in tasks)
+        print(f"     [MF] {len(alive)}/{len(tasks)} candidates measured fully, "
+              f"{simulated}/{len(tasks) * full_steps} measure steps simulated")
+
+    censored = [False] * len(tasks)
+    for i in pruned:
+        censored[i] = True
+    return costs, censored
+
+
+class SumoBridgePool:
+    """
+    A pool of twin bridges, each one driving its own headless SUMO instance.
+    All twins restore the same checkpoint, so a whole generation can be evaluated concurrently.
+
+    Twins on this host share one checkpoint store, the fast path: the live state is saved once and
+    states derived from it (suspended candidates, replicates) can be resumed by any local twin.
+    Twins on other hosts get the state exported as bytes and shipped to their state server.
+    """
+
+    def __init__(self, sumo_adapters, checkpoint_root=None, state_format="binary"):
+        if not sumo_adapters:
+            raise ValueError("SumoBridgePool needs at least one adapter")
+
+        self.checkpoint_store = CheckpointStore(checkpoint_root, state_format)
+        self.bridges = [SumoBridge(adapter) for adapter in sumo_adapters]
+        self.local_bridges = [bridge for bridge in self.bridges if bridge.adapter.is_local]
+        self.remote_bridges = [bridge for bridge in self.bridges if not bridge.adapter.is_local]
+        # Replicate states of local twins live in the shared store, so each one is derived by a single
+        # local twin per checkpoint; remote twins derive their own
+        replicate_checkpoints = {}
+        replicate_lock = threading.Lock()
+        for bridge in self.local_bridges:
+            bridge._replicate_checkpoints = replicate_checkpoints
+            bridge._replicate_lock = replicate_lock
+        self.n_dim = self.bridges[0].n_dim
+        self.bounds = self.bridges[0].bounds
+        self.multi_fidelity = False
+        self.replicates = 1
+        self.min_replicates = EVALUATION_MIN_REPLICATES
+        self.common_random_numbers = False
+
+        # Idle twins; a worker borrows one for the duration of a single evaluation
+        self._idle = queue.Queue()
+        for bridge in self.bridges:
+            self._idle.put(bridge)
+        self._executor = None
+
+    @property
+    def started(self):
+        return self._executor is not None
+
+    @property
+    def size(self):
+        return len(self.bridges)
+
+    @property
+    def simulated_steps(self):
+        return sum(bridge.simulated_steps for bridge in self.bridges)
+
+    @property
+    def received_bytes(self):
+        return sum(bridge.received_bytes for bridge in self.remote_bridges)
+
+    @property
+    def checkpoint(self):
+        return self.bridges[0].checkpoint
+
+    @checkpoint.setter
+    def checkpoint(self, path):
+        for bridge in self.bridges:
+            bridge.checkpoint = path
+
+    def take_checkpoint(self, source_adapter, name):
+        """
+        Saves the live state once to the shared store, every local twin restores from it. Remote twins
+        get the state bytes shipped to their host. Returns the report: bytes and seconds of the save,
+        shipped_bytes and ship_seconds of the transfer (0 without remote twins).
+        """
+        started = time.perf_counter()
+        report = {"bytes": 0, "seconds": 0.0, "shipped_bytes": 0, "ship_seconds": 0.0}
+
+        path = None
+        if self.local_bridges:
+            path = self.checkpoint_store.save(source_adapter, name)
+            for bridge in self.local_bridges:
+                bridge.checkpoint = path
+            report["bytes"] = os.path.getsize(path)
+            report["seconds"] = time.perf_counter() - started
+
+        if self.remote_bridges:
+            shipping = time.perf_counter()
+            if path is not None:
+                data = source_adapter.fetch_state(path)
+            else:
+                data = source_adapter.export_state(self.checkpoint_store.state_format)
+                report["bytes"] = len(data)
+                report["seconds"] = time.perf_counter() - started
+
+            suffix = self.checkpoint_store.suffix
+            if self._executor is None:
+                for bridge in self.remote_bridges:
+                    bridge.receive_checkpoint(data, name, suffix)
+            else:
+                futures = [self._executor.submit(bridge.receive_checkpoint, data, name, suffix)
+                           for bridge in self.remote_bridges]
+                for future in futures:
+                    future.result()
+            report["shipped_bytes"] = len(data) * len(self.remote_bridges)
+            report["ship_seconds"] = time.perf_counter() - shipping
+
+        return report
+
+    def release_checkpoint(self, name):
+        path = self.checkpoint_store.path(name)
+        for bridge in self.local_bridges:
+            bridge.forget_checkpoint(path)
+        for bridge in self.remote_bridges:
+            bridge.release_received_checkpoint(name, self.checkpoint_store.suffix)
+        self.checkpoint_store.release(name)
+
+    def start(self, seed=None):
+        """Spawns all twins once; they are kept warm and only re-load checkpoints afterwards."""
+        if self.started:
+            return
+        for bridge in self.bridges:
+            bridge.start(seed=seed)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="twin")
+
+    def ensure_healthy(self):
+        """Restarts every twin that crashed since the last adaptation. Returns the number of restarts."""
+        return sum(bridge.ensure_healthy() for bridge in self.bridges)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for bridge in self.bridges:
+            bridge.close()
+        self.checkpoint_store.close()
+
+    def _run_on_idle_twin(self, fn, item):
+        bridge = self._idle.get()
+        try:
+            try:
+                return fn(bridge, item)
+            except Exception:
+                # A twin that crashed mid-evaluation is restarted and the item retried once on it
+                if not bridge.ensure_healthy():
+                    raise
+                return fn(bridge, item)
+        finally:
+            self._idle.put(bridge)
+
+    def map(self, fn, items):
+        """
+        Runs fn(bridge, item) for every item on the first idle twin, results are returned in input order.
+        """
+        if self._executor is None:
+            raise RuntimeError("SumoBridgePool must be started before evaluating")
+
+        futures = [self._executor.submit(self._run_on_idle_twin, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+    def evaluate(self, configuration, log=True):
+        if self.replicates > 1 or self.common_random_numbers:
+            return [replicated_evaluation(self, [configuration], log=log)[0]]
+        return self.map(lambda bridge, cfg: bridge.evaluate(cfg, log), [configuration])[0]
+
+    def evaluate_batch(self, configurations, log=True, incumbent=None):
+        if self.multi_fidelity:
+            return successive_halving(self, configurations, log=log)[0]
+        if self.replicates > 1 or self.common_random_numbers:
+            return replicated_evaluation(self, configurations, incumbent=incumbent, log=log)
+        return self.map(lambda bridge, cfg: bridge.evaluate(cfg, log)[0], configurations)
+
+    def measure_batch(self, configurations, log=True, incumbent=None):
+        return measure_batch(self, configurations, log, incumbent)
+
+    def race_batch(self, configurations, threshold, log=True, incumbent=None):
+        return race(self, configurations, threshold, log, incumbent)
@@ -1,11 +1,12 @@
 import os
 import random
-from itertools import combinations
+from collections import Counter
 import numpy as np
 import pandas as pd
 import time
 
 
+from dlisa_source.Config_Archive import ConfigArchive
 from dlisa_source.Genetic_Algorithm import GeneticAlgorithm
 
 class AdaptationOptimizer:
@@ -20,7 +21,9 @@ class AdaptationOptimizer:
     #     self.crossover_rate = crossover_rate
     #     self.optimization_goal = optimization_goal
     ######
-    def __init__(self, max_generation, pop_size, mutation_rate, crossover_rate, compared_algorithms, system, optimization_goal):
+    def __init__(self, max_generation, pop_size, mutation_rate, crossover_rate, compared_algorithms, system, optimization_goal,
+                 knowledge_base=None, config_bounds=None, max_environments=None, max_environments_per_label=None,
+                 max_labels=None, history_decay=1.0):
         self.max_generation = max_generation
         self.pop_size = pop_size
         self.compared_algorithms = compared_algorithms
@@ -36,28 +39,124 @@ class AdaptationOptimizer:
         self.his_envs_name = []
         self.his_evaluated_configs_to_perfs = []
         self.similarity_score = {}
-
-    ###### NEW METHOD: REGISTER RESULTS FROM MAIN LOOP
-    def register_workload_result(self, environment_name, population_configs, population_perfs,
-                                 evaluated_configs_map):
-        """
-        DLiSA Learning Step:
-        Saves the results of the recent optimization so they can be distilled later.
-        """
+        # (env i map, env i+1 map, similarity) of consecutive history entries
+        self._similarity_cache = []
+        # Seeding index over the historical top-k optima, see _index_environment
+        self._optima_index = {}
+        self._indexed_envs = 0
+
+        # With known bounds every evaluated map is stored as a ConfigArchive snapshot
+        self.config_bounds = config_bounds
+
+        # Retention policy of the history lists (None = unbounded)
+        # - max_environments: oldest environments are evicted first
+        # - max_environments_per_label: oldest environments of an over-full label are evicted
+        # - max_labels: all environments of the least recently registered label are evicted
+        # - history_decay: per-environment decay of the robustness weight used for seeding (1.0 = no decay)
+        self.max_environments = max_environments
+        self.max_environments_per_label = max_environments_per_label
+        self.max_labels = max_labels
+        self.history_decay = history_decay
+        self._label_last_used = {}
+        self._registrations = 0
+
+        # Optional persistent memory, history of previous runs is loaded right away
+        self.knowledge_base = knowledge_base
+        if self.knowledge_base is not None:
+            self.load_knowledge_base()
+
+    def load_knowledge_base(self):
+        """Warm-start: fills the history lists from the persistent knowledge base."""
+        results = self.knowledge_base.load_results()
+        for result in results:
+            self._append_history(result["workload"], result["population_configs"], result["population_perfs"],
+                                 result["evaluated_configs_map"])
+        self._apply_retention()
+        self.similarity_score.update(self.knowledge_base.load_similarity())
+
+        if results:
+            print(f"   [DLiSA] Loaded {len(results)} workload results from {self.knowledge_base.path}")
+
+    def _append_history(self, environment_name, population_configs, population_perfs, evaluated_configs_map):
         # Create fake IDs based on hash (since we don't have CSV row IDs)
         pop_ids = [hash(tuple(c)) for c in population_configs]
 
+        self._registrations += 1
+        self._label_last_used[environment_name] = self._registrations
+
         self.his_envs_name.append(environment_name)
         self.his_pop_configs.append(np.array(population_configs))
         self.his_pop_perfs.append(np.array(population_perfs))
         self.his_pop_ids.append(np.array(pop_ids))
+        if self._indexed_envs == len(self.his_pop_configs) - 1:
+            self._index_environment(len(self.his_pop_configs) - 1, self.his_pop_configs[-1], self.his_pop_perfs[-1],
+                                    self.his_pop_ids[-1])
+        if self.config_bounds is not None:
+            # Snapshot, the GA keeps mutating its own map after registration
+            evaluated_configs_map = ConfigArchive.from_mapping(evaluated_configs_map, self.config_bounds)
         self.his_evaluated_configs_to_perfs.append(evaluated_configs_map)
 
+    def _retention_victim(self):
+        """Position of the next history environment to evict, None if the history satisfies the policy."""
+        if self.max_labels is not None:
+            labels = set(self.his_envs_name)
+            if len(labels) > self.max_labels:
+                lru_label = min(labels, key=lambda label: self._label_last_used.get(label, 0))
+                return self.his_envs_name.index(lru_label)
+
+        if self.max_environments_per_label is not None:
+            label_counts = Counter(self.his_envs_name)
+            for position, name in enumerate(self.his_envs_name):
+                if label_counts[name] > self.max_environments_per_label:
+                    return position
+
+        if self.max_environments is not None and len(self.his_envs_name) > self.max_environments:
+            return 0
+
+        return None
+
+    def _apply_retention(self):
+        victim = self._retention_victim()
+        while victim is not None:
+            self._evict_environment(victim)
+            victim = self._retention_victim()
+
+    def _evict_environment(self, position):
+        # Only shift the seeding index when it covers the whole history, otherwise seeding rebuilds it anyway
+        index_in_sync = self._indexed_envs == len(self.his_pop_configs)
+
+        for his_list in (self.his_envs_name, self.his_pop_configs, self.his_pop_perfs, self.his_pop_ids,
+                         self.his_evaluated_configs_to_perfs):
+            del his_list[position]
+
+        # Cached consecutive similarities: the pair starting at the evicted environment goes away, the pair
+        # ending at it now bridges the gap and fails the identity check, so only that one is recomputed
+        del self._similarity_cache[position:position + 1]
+        del self._similarity_cache[max(len(self.his_evaluated_configs_to_perfs) - 1, 0):]
+
+        if index_in_sync:
+            self._unindex_environment(position)
+
+    ###### NEW METHOD: REGISTER RESULTS FROM MAIN LOOP
+    def register_workload_result(self, environment_name, population_configs, population_perfs,
+                                 evaluated_configs_map):
+        """
+        DLiSA Learning Step:
+        Saves the results of the recent optimization so they can be distilled later.
+        """
+        self._append_history(environment_name, population_configs, population_perfs, evaluated_configs_map)
+        self._apply_retention()
+        if self.knowledge_base is not None:
+            self.knowledge_base.add_result(environment_name, population_configs, population_perfs,
+                                           evaluated_configs_map)
+
         # Calculate Similarity if we have history
         if len(self.his_pop_configs) > 1:
             sim = self.calculate_average_similarity(self.his_evaluated_configs_to_perfs, beta=0.3)
             self.similarity_score[environment_name] = sim
             print(f"   [DLiSA] Workload Similarity: {sim:.2f}")
+            if self.knowledge_base is not None:
+                self.knowledge_base.set_similarity(environment_name, sim)
 
 
     def dynamic_optimization(self, data_folder, data_files, run_no):
@@ -377,14 +476,36 @@ class AdaptationOptimizer:
             # Check Similarity Threshold
             if average_similarity >= beta:
                 print("   [DLiSA] High Similarity -> Using Distilled Seeding")
-                return self.generate_next_population_based_high_similarity(config_space)
+                init_pop_config, _ = self.generate_next_population_based_high_similarity(config_space)
             else:
                 print("   [DLiSA] Low Similarity -> Random Initialization")
-                return self.initialize_population(config_space, self.pop_size)
+                init_pop_config, _ = self.initialize_population(config_space, self.pop_size)
+
+            # CHANGED: Evaluated maps are scoped to their environment, so two environments only share the
+            # configs measured in both. The top half of the previous population is measured again in the new
+            # environment (its cached perfs are not reused), which gives the similarity common solutions to rank
+            return self.with_previous_top_half(config_space, init_pop_config)
 
         # Default fallback
         return self.initialize_population(config_space, self.pop_size)
 
+    def with_previous_top_half(self, config_space, init_pop_config):
+        """
+        Population made of the best half of the last environment's population, completed with the
+        configs of init_pop_config that are not already in it (then random ones). Ids are config hashes.
+        """
+        previous_configs, _ = self.find_top_k_configs(self.his_pop_configs[-1], self.his_pop_perfs[-1],
+                                                      self.his_pop_ids[-1], top_k=self.pop_size // 2)
+        population = []
+        seen = set()
+        for config in list(previous_configs) + list(init_pop_config):
+            key = tuple(int(v) for v in config)
+            if key not in seen and len(population) < self.pop_size:
+                seen.add(key)
+                population.append(list(key))
+
+        return self.initialize_population(config_space, self.pop_size, existing_configs=population)
+
 
     def find_top_k_configs(self, configs, perfs, configs_ids, top_k=10):
         # find top k configs that perform better
@@ -397,45 +518,77 @@ class AdaptationOptimizer:
         top_k_configs_ids = [configs_ids[i] for i in top_indices]
         return top_k_configs, top_k_configs_ids
 
-    def generate_next_population_based_high_similarity(self, config_space):
-
-        all_local_optima_configs = []
-        all_local_optima_ids = []
-
-        # collect those configs that perform better from each historical workload environment
-        for configs, perfs, configs_ids in zip(self.his_pop_configs, self.his_pop_perfs, self.his_pop_ids):
-            # local_optima_indices = self.find_local_optima(config, perf, config_ids)
-            top_k_configs, top_k_configs_ids = self.find_top_k_configs(configs, perfs, configs_ids, top_k=10)
-            all_local_optima_configs.extend(top_k_configs)
-            all_local_optima_ids.extend(top_k_configs_ids)
+    def _index_environment(self, env_num, configs, perfs, configs_ids):
+        """Adds one historical environment to the optima index (config -> top-k occurrence envs, latest env, id)."""
+        top_k_configs, top_k_configs_ids = self.find_top_k_configs(configs, perfs, configs_ids, top_k=10)
+        for config, config_id in zip(top_k_configs, top_k_configs_ids):
+            entry = self._optima_index.setdefault(tuple(int(v) for v in config),
+                                                  {"envs": [], "ids": [], "pop_envs": [], "latest_env": -1,
+                                                   "id": None})
+            entry["envs"].append(env_num)
+            entry["ids"].append(config_id)
+            entry["id"] = config_id
+
+        # Timeliness: the latest environment whose population contains the optimum
+        for config in configs:
+            entry = self._optima_index.get(tuple(int(v) for v in config))
+            if entry is not None and (not entry["pop_envs"] or entry["pop_envs"][-1] != env_num):
+                entry["pop_envs"].append(env_num)
+                entry["latest_env"] = env_num
+
+        self._indexed_envs += 1
+
+    def _unindex_environment(self, position):
+        """Removes an evicted environment from the optima index and shifts the later environments down."""
+        for config in list(self._optima_index):
+            entry = self._optima_index[config]
+            kept = [(env - (env > position), config_id) for env, config_id in zip(entry["envs"], entry["ids"])
+                    if env != position]
+            if not kept:
+                del self._optima_index[config]
+                continue
+
+            entry["envs"] = [env for env, _ in kept]
+            entry["ids"] = [config_id for _, config_id in kept]
+            entry["id"] = entry["ids"][-1]
+            # A config only counts for timeliness from the first environment that ranked it top-k
+            entry["pop_envs"] = [env - (env > position) for env in entry["pop_envs"]
+                                 if env != position and env - (env > position) >= entry["envs"][0]]
+            entry["latest_env"] = entry["pop_envs"][-1] if entry["pop_envs"] else -1
+
+        self._indexed_envs -= 1
+
+    def _rebuild_optima_index(self):
+        self._optima_index = {}
+        self._indexed_envs = 0
+        for env_num, (configs, perfs, configs_ids) in enumerate(zip(self.his_pop_configs, self.his_pop_perfs,
+                                                                    self.his_pop_ids)):
+            self._index_environment(env_num, configs, perfs, configs_ids)
 
-        # Count the number of occurrences of each relatively optimal configuration and convert to hashable form
-        hashable_optima_configs = [tuple(config) for config in all_local_optima_configs]
-        unique_optima_configs, counts = np.unique(hashable_optima_configs, axis=0, return_counts=True)
+    def generate_next_population_based_high_similarity(self, config_space):
+        # CHANGED: Optima counts and latest environments come from the index maintained at registration,
+        # instead of rescanning every historical population for every unique optimum
+        if self._indexed_envs != len(self.his_pop_configs):
+            # History was modified without _append_history (e.g. dynamic_optimization)
+            self._rebuild_optima_index()
+
+        # Unique relatively optimal configurations, in a stable (sorted) order
+        unique_optima_configs = sorted(self._optima_index)
+        entries = [self._optima_index[config] for config in unique_optima_configs]
+        # Occurrence counts, older environments weigh less when history_decay < 1
+        n_envs = len(self.his_pop_ids)
+        counts = np.array([sum(self.history_decay ** (n_envs - 1 - env) for env in entry["envs"]) for entry in entries])
+        latest_env = np.array([entry["latest_env"] for entry in entries])
 
         # hashable config->id
-        config_to_id_mapping = {tuple(config): id for config, id in
-                                zip(all_local_optima_configs, all_local_optima_ids)}
-
-        # Calculate the latest environment number in which each solution occurs
-        latest_env_num = {}
-        for config in unique_optima_configs:
-            latest_env = -1
-            for i, env_configs in enumerate(self.his_pop_configs):
-                if tuple(config) in [tuple(cfg) for cfg in env_configs]:
-                    latest_env = i
-            latest_env_num[tuple(config)] = latest_env
+        config_to_id_mapping = {config: entry["id"] for config, entry in zip(unique_optima_configs, entries)}
 
         # Calculate the compound weight of each considered configs
-        compound_weights = []
-        for config, count in zip(unique_optima_configs, counts):
-            repeat_weight = count / len(self.his_pop_ids)  # robustness weight
-            latest_weight = (1 + latest_env_num[tuple(config)]) / len(self.his_pop_ids)  # timeliness weight
-            compound_weight = repeat_weight + latest_weight
-            compound_weights.append(compound_weight)
+        repeat_weight = counts / len(self.his_pop_ids)  # robustness weight
+        latest_weight = (1 + latest_env) / len(self.his_pop_ids)  # timeliness weight
+        compound_weights = repeat_weight + latest_weight
 
         # Calculate the probability of selection
-        compound_weights = np.array(compound_weights)
         probabilities = compound_weights / compound_weights.sum()
 
         # Selection configs to transfer according to the probability
@@ -495,19 +648,29 @@ class AdaptationOptimizer:
         :param common_solutions: those solutions that are evaluated both in env1 and env2
         :return:
         '''
+        common_solutions = list(common_solutions)
+        perfs_env1 = np.array([env1[sol] for sol in common_solutions], dtype=float)
+        perfs_env2 = np.array([env2[sol] for sol in common_solutions], dtype=float)
+        return self.ranking_similarity(perfs_env1, perfs_env2, beta)
 
-        if len(common_solutions) > self.pop_size * 0.25:
-            total_pairs = 0
+    def ranking_similarity(self, perfs_env1, perfs_env2, beta):
+        '''
+        Kendall-style ranking consistency of the common solutions, perfs_env1[i] and perfs_env2[i] belong to the same solution.
+        All pairs are compared at once with NumPy instead of looping over itertools.combinations.
+        '''
+        k = len(perfs_env1)
+        if k > self.pop_size * 0.25:
+            total_pairs = k * (k - 1) // 2
             consistent_pairs = 0
-            for sol1, sol2 in combinations(common_solutions, 2):
-                total_pairs += 1
-                perf_env1_sol1 = env1[sol1]
-                perf_env1_sol2 = env1[sol2]
-                perf_env2_sol1 = env2[sol1]
-                perf_env2_sol2 = env2[sol2]
+            # Row blocks bound the k x k comparison matrices for very large archives
+            for start in range(0, k, 1024):
+                rows = slice(start, min(k, start + 1024))
+                better_env1 = perfs_env1[rows, None] > perfs_env1[None, :]
+                better_env2 = perfs_env2[rows, None] > perfs_env2[None, :]
+                # Only pairs (i, j) with i < j, like combinations()
+                upper = np.arange(start, rows.stop)[:, None] < np.arange(k)[None, :]
                 # match the ranking consistency
-                if (perf_env1_sol1 > perf_env1_sol2) == (perf_env2_sol1 > perf_env2_sol2):
-                    consistent_pairs += 1
+                consistent_pairs += int(((better_env1 == better_env2) & upper).sum())
             similarity_score = consistent_pairs / total_pairs if total_pairs > 0 else 0
         else:
             if beta == 0.0:
@@ -518,6 +681,18 @@ class AdaptationOptimizer:
 
         return similarity_score
 
+    def pair_similarity(self, env1_evaluated_configs_to_perfs, env2_evaluated_configs_to_perfs, beta):
+        if isinstance(env1_evaluated_configs_to_perfs, ConfigArchive) and \
+                isinstance(env2_evaluated_configs_to_perfs, ConfigArchive):
+            # Archives over the same grid: common solutions are simply the indices evaluated in both
+            common = env1_evaluated_configs_to_perfs.evaluated_mask() & env2_evaluated_configs_to_perfs.evaluated_mask()
+            return self.ranking_similarity(env1_evaluated_configs_to_perfs.perfs[common],
+                                           env2_evaluated_configs_to_perfs.perfs[common], beta)
+
+        common_solutions = set(env1_evaluated_configs_to_perfs.keys()) & set(env2_evaluated_configs_to_perfs.keys())
+        return self.calculate_similarity(env1_evaluated_configs_to_perfs, env2_evaluated_configs_to_perfs,
+                                         common_solutions, beta)
+
     def calculate_average_similarity(self, his_evaluated_configs_to_perfs, beta):
         n = len(his_evaluated_configs_to_perfs)
         total_similarity = 0
@@ -525,8 +700,20 @@ class AdaptationOptimizer:
         for i in range(n-1):
             env1_evaluated_configs_to_perfs = his_evaluated_configs_to_perfs[i]
             env2_evaluated_configs_to_perfs = his_evaluated_configs_to_perfs[i + 1]
-            common_solutions = set(env1_evaluated_configs_to_perfs.keys()) & set(env2_evaluated_configs_to_perfs.keys())
-            similarity = self.calculate_similarity(env1_evaluated_configs_to_perfs, env2_evaluated_configs_to_perfs, common_solutions, beta)
+
+            # Consecutive pairs are cached, so a new registration only computes the newly appended pair
+            if i < len(self._similarity_cache) and \
+                    self._similarity_cache[i][0] is env1_evaluated_configs_to_perfs and \
+                    self._similarity_cache[i][1] is env2_evaluated_configs_to_perfs:
+                similarity = self._similarity_cache[i][2]
+            else:
+                similarity = self.pair_similarity(env1_evaluated_configs_to_perfs, env2_evaluated_configs_to_perfs, beta)
+                cached_pair = (env1_evaluated_configs_to_perfs, env2_evaluated_configs_to_perfs, similarity)
+                if i < len(self._similarity_cache):
+                    self._similarity_cache[i] = cached_pair
+                else:
+                    self._similarity_cache.append(cached_pair)
+
             total_similarity += similarity
             count += 1
 
@@ -0,0 +1,95 @@
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+class ConfigArchive(MutableMapping):
+    """
+    Evaluation archive over a bounded integer config space.
+
+    Every config is encoded to a dense integer index (mixed radix over the bounds) and its perf is
+    stored in a preallocated NumPy array, NaN meaning "not evaluated". It still behaves like the
+    {config tuple: perf} dict it replaces, and adds vectorized access for similarity.
+    """
+
+    def __init__(self, bounds):
+        bounds = np.array(bounds, dtype=np.int64)
+        self.bounds = bounds
+        self.low = bounds[:, 0]
+        self.sizes = bounds[:, 1] - bounds[:, 0] + 1
+        # Row-major strides: the last gene varies fastest
+        self.strides = np.concatenate((np.cumprod(self.sizes[::-1])[::-1][1:], [1])).astype(np.int64)
+        self.size = int(np.prod(self.sizes))
+
+        self.perfs = np.full(self.size, np.nan)
+        self._count = 0
+
+    @classmethod
+    def from_mapping(cls, configs_to_perfs, bounds):
+        if isinstance(configs_to_perfs, ConfigArchive):
+            return configs_to_perfs.copy()
+        archive = cls(bounds)
+        for config, perf in configs_to_perfs.items():
+            archive[config] = perf
+        return archive
+
+    def copy(self):
+        archive = ConfigArchive(self.bounds)
+        archive.perfs = self.perfs.copy()
+        archive._count = self._count
+        return archive
+
+    # --- encoding ---
+
+    def encode(self, config):
+        """Dense index of a config, -1 if it lies outside the bounds."""
+        offsets = np.asarray(config, dtype=np.int64) - self.low
+        if offsets.shape != self.low.shape or (offsets < 0).any() or (offsets >= self.sizes).any():
+            return -1
+        return int(offsets @ self.strides)
+
+    def decode_many(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        return (indices[:, None] // self.strides) % self.sizes + self.low
+
+    # --- mapping interface ---
+
+    def __getitem__(self, config):
+        index = self.encode(config)
+        if index < 0 or np.isnan(self.perfs[index]):
+            raise KeyError(config)
+        return float(self.perfs[index])
+
+    def __setitem__(self, config, perf):
+        index = self.encode(config)
+        if index < 0:
+            raise ValueError(f"Config {config} is outside the archive bounds")
+        if np.isnan(self.perfs[index]):
+            self._count += 1
+        self.perfs[index] = perf
+
+    def __delitem__(self, config):
+        index = self.encode(config)
+        if index < 0 or np.isnan(self.perfs[index]):
+            raise KeyError(config)
+        self.perfs[index] = np.nan
+        self._count -= 1
+
+    def __contains__(self, config):
+        index = self.encode(config)
+        return index >= 0 and not np.isnan(self.perfs[index])
+
+    def __iter__(self):
+        for config in self.decode_many(self.evaluated_indices()).tolist():
+            yield tuple(config)
+
+    def __len__(self):
+        return self._count
+
+    # --- vectorized access ---
+
+    def evaluated_mask(self):
+        return ~np.isnan(self.perfs)
+
+    def evaluated_indices(self):
+        return np.flatnonzero(self.evaluated_mask())
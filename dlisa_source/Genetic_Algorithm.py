@@ -5,16 +5,40 @@ from matplotlib import pyplot as plt
 from sklearn.cluster import AgglomerativeClustering
 from scipy.spatial.distance import cdist
 
+from dlisa_source.Config_Archive import ConfigArchive
+
 class GeneticAlgorithm:
-    def __init__(self, pop_size, mutation_rate, crossover_rate, optimization_goal):
+    def __init__(self, pop_size, mutation_rate, crossover_rate, optimization_goal, surrogate=None,
+                 surrogate_pool_factor=4, surrogate_top_n=None, bounds=None, early_termination=False,
+                 transfer_priors=True):
         self.pop_size = pop_size
         self.mutation_rate = mutation_rate
         self.crossover_rate = crossover_rate
-        self.evaluated_configs = []
-        self.evaluated_configs_ids = []
-        self.evaluated_configs_to_perfs = {}
+        # With known bounds the evaluated config -> perf map is a dense, integer-encoded archive
+        self.bounds = bounds
+        self.evaluated_configs_to_perfs = ConfigArchive(bounds) if bounds is not None else {}
+        # Integer keys of the evaluated configs for O(1) novelty checks
+        self.evaluated_keys = set()
         self.optimization_goal = optimization_goal
 
+        # Optional surrogate pre-screening: pool_factor * pop_size offspring are generated,
+        # only the surrogate's top_n of them are evaluated in the twin
+        self.surrogate = surrogate
+        self.surrogate_pool_factor = surrogate_pool_factor
+        self.surrogate_top_n = surrogate_top_n if surrogate_top_n is not None else pop_size
+        self.surrogate_stats = {"screened": 0, "simulated": 0, "saved": 0}
+
+        # Optional racing: offspring measurements stop once they provably cannot survive truncation selection.
+        # Their perf is then only a lower bound (censored), kept out of the returned map and the surrogate.
+        # Candidates pruned by successive halving only get an extrapolated perf and are censored as well.
+        self.early_termination = early_termination
+        self.censored_keys = set()
+
+        # Evaluations are only valid for the (workload, checkpoint) they were measured under, see
+        # begin_evaluation_scope. Older perfs reach the surrogate as priors only if transfer_priors is set.
+        self.evaluation_scope = None
+        self.transfer_priors = transfer_priors
+
     ###### ORIGINAL run
     # def run(self, init_pop_config, init_pop_config_ids, config_space, perf_space, max_generation,
     #         environmental_selection_type, selected_algorithm, run_no, system, environment_name):
@@ -78,8 +102,10 @@ class GeneticAlgorithm:
     #     return optimized_pop_configs, optimized_pop_perfs, optimized_pop_indices, self.evaluated_configs_to_perfs
     ######
 
-    def run(self, init_pop_config, init_pop_config_ids, config_space, perf_space, max_generation, bridge=None):
+    def run(self, init_pop_config, init_pop_config_ids, config_space, perf_space, max_generation, bridge=None,
+            prior_configs_to_perfs=None):
         # CHANGED: Added 'bridge' parameter and remove other unused parameters
+        # prior_configs_to_perfs: older {config: perf} maps of the same workload, only used to train the surrogate
 
         parent_configs = init_pop_config.copy()
         parent_ids = init_pop_config_ids.copy()
@@ -91,11 +117,23 @@ class GeneticAlgorithm:
 
         for i in range(max_generation):
             # Generate Offspring
-            offspring_configs, offspring_ids = self.generate_offspring_by_cro_mut(parent_perfs, config_space,
-                                                                                  parent_configs)
+            if self.train_surrogate(prior_configs_to_perfs):
+                offspring_configs, offspring_ids = self.generate_offspring_screened(parent_perfs, config_space,
+                                                                                    parent_configs)
+            else:
+                offspring_configs, offspring_ids = self.generate_offspring_by_cro_mut(parent_perfs, config_space,
+                                                                                      parent_configs)
+
+            # The generator gives up on a (nearly) exhausted config space, nothing new is left to evaluate
+            if len(offspring_configs) == 0:
+                print(f"     [GA] No new offspring in gen {i}, stopping early")
+                break
 
-            # CHANGED: Evaluate Offspring with bridge
-            offspring_perfs, offspring_ids = self.evaluate(offspring_ids, offspring_configs, perf_space, bridge)
+            # CHANGED: Evaluate Offspring with bridge, racing them against the worst parent if enabled and
+            # stopping their replicates once they are separated from the best parent
+            offspring_perfs, offspring_ids = self.evaluate(offspring_ids, offspring_configs, perf_space, bridge,
+                                                           self.selection_threshold(parent_perfs),
+                                                           self.incumbent_perf(parent_perfs))
 
             combined_population = np.vstack((parent_configs, offspring_configs))
             combined_performance = np.concatenate((parent_perfs, offspring_perfs))
@@ -113,7 +151,33 @@ class GeneticAlgorithm:
 
             print(f"     [GA] Gen {i} Best: {parent_perfs[0]:.2f} Config: {parent_configs[0]}")
 
-        return parent_configs, parent_perfs, parent_ids, self.evaluated_configs_to_perfs
+        return parent_configs, parent_perfs, parent_ids, self.uncensored_configs_to_perfs()
+
+    def selection_threshold(self, parent_perfs):
+        """
+        Perf an offspring has to beat to survive truncation selection: the worst parent (every parent
+        stays ahead of an offspring that does not beat it). None if racing does not apply.
+        """
+        if not self.early_termination or self.optimization_goal != 'minimum':
+            return None
+        return float(np.max(parent_perfs))
+
+    def incumbent_perf(self, parent_perfs):
+        """Best parent perf, replicated evaluation stops sampling offspring that are clearly apart from it."""
+        if self.optimization_goal != 'minimum':
+            return None
+        return float(np.min(parent_perfs))
+
+    def uncensored_configs_to_perfs(self):
+        """The evaluated config -> perf map without censored (lower bound) perfs."""
+        if not self.censored_keys:
+            return self.evaluated_configs_to_perfs
+
+        evaluated = self.evaluated_configs_to_perfs.copy()
+        for key in self.censored_keys:
+            if key in evaluated:
+                del evaluated[key]
+        return evaluated
 
 
     ###### ORIGINAL evaluate
@@ -143,106 +207,205 @@ class GeneticAlgorithm:
     ######
 
 
-    def evaluate(self, population_ids, population_configs, perf_space, bridge=None):
-        # CHANGED: Now accepts 'bridge'
-        performance = []
+    def evaluate(self, population_ids, population_configs, perf_space, bridge=None, threshold=None, incumbent=None):
+        # CHANGED: Now accepts 'bridge', a selection 'threshold' for racing and the 'incumbent' perf for replicates
+        performance = [None] * len(population_configs)
+
+        # Configs that need a twin run: config tuple -> positions in the population
+        pending = {}
+        pending_configs = []
 
-        for idx, individual_config in zip(population_ids, population_configs):
+        for pos, (idx, individual_config) in enumerate(zip(population_ids, population_configs)):
             # Check cache first
             config_tuple = tuple(individual_config)
 
-            if config_tuple in self.evaluated_configs_to_perfs:
-                perf = self.evaluated_configs_to_perfs[config_tuple]
+            if config_tuple in self.evaluated_configs_to_perfs and self.is_cached_perf_usable(config_tuple, threshold):
+                performance[pos] = self.evaluated_configs_to_perfs[config_tuple]
+            elif bridge:
+                # Defer twin runs so the whole population goes to the bridge as one batch
+                if config_tuple not in pending:
+                    pending[config_tuple] = []
+                    pending_configs.append(individual_config)
+                pending[config_tuple].append(pos)
             else:
-                # CRITICAL FIX: Use Bridge if available
-                if bridge:
-                    # bridge.evaluate returns a list [cost], we take index 0
-                    perf = bridge.evaluate(individual_config)[0]
-                elif idx != -1 and perf_space is not None:
+                if idx != -1 and perf_space is not None:
                     perf = perf_space[idx]
                 else:
                     # Fallback for testing
                     perf = random.uniform(100, 200)
 
-                self.evaluated_configs.append(individual_config)
-                self.evaluated_configs_ids.append(idx)
-                self.evaluated_configs_to_perfs[config_tuple] = perf
+                self.record_evaluation(individual_config, perf)
+                performance[pos] = perf
 
-            performance.append(perf)
+        if pending_configs:
+            # CHANGED: A bridge pool evaluates the batch concurrently, costs come back in input order
+            if threshold is not None:
+                perfs, censored = bridge.race_batch(pending_configs, threshold, incumbent=incumbent)
+            else:
+                # Successive halving only extrapolates pruned candidates, they come back censored
+                perfs, censored = bridge.measure_batch(pending_configs, incumbent=incumbent)
+            for individual_config, perf, is_censored in zip(pending_configs, perfs, censored):
+                self.record_evaluation(individual_config, perf, is_censored)
+                for pos in pending[tuple(individual_config)]:
+                    performance[pos] = perf
 
         return np.array(performance), population_ids
 
-    def generate_offspring_by_cro_mut(self, parent_perfs, config_space, parent_configs):
-        offspring_configs = []
-        offspring_ids = []
-        while len(offspring_configs) < self.pop_size:
+    def begin_evaluation_scope(self, workload, checkpoint):
+        """
+        Starts caching evaluations for one adaptation. Perfs cached under another scope were measured
+        from another checkpoint (and maybe workload), so they are dropped instead of being reused as fresh.
+        """
+        scope = (workload, checkpoint)
+        if scope != self.evaluation_scope:
+            self.invalidate_evaluations()
+            self.evaluation_scope = scope
+        return scope
+
+    def invalidate_evaluations(self):
+        self.evaluated_configs_to_perfs = ConfigArchive(self.bounds) if self.bounds is not None else {}
+        self.evaluated_keys = set()
+        self.censored_keys = set()
+        self.evaluation_scope = None
+
+    def is_cached_perf_usable(self, config_tuple, threshold=None):
+        """A censored perf is only a lower bound, it still decides selection if it exceeds the threshold."""
+        if config_tuple not in self.censored_keys:
+            return True
+        return threshold is not None and self.evaluated_configs_to_perfs[config_tuple] > threshold
+
+    def record_evaluation(self, config, perf, censored=False):
+        self.evaluated_keys.add(tuple(int(v) for v in config))
+        self.evaluated_configs_to_perfs[tuple(config)] = perf
+        if censored:
+            self.censored_keys.add(tuple(config))
+        else:
+            self.censored_keys.discard(tuple(config))
+
+    def train_surrogate(self, prior_configs_to_perfs=None):
+        """Refits the surrogate on everything evaluated so far. Returns True if it can be used for screening."""
+        if self.surrogate is None:
+            return False
+
+        training_set = {}
+        for prior_map in (prior_configs_to_perfs or []) if self.transfer_priors else []:
+            training_set.update(prior_map)
+        # Fresh measurements override priors of the same config
+        training_set.update(self.uncensored_configs_to_perfs())
+
+        self.surrogate.fit(training_set)
+        return self.surrogate.is_ready
+
+    def generate_offspring_screened(self, parent_perfs, config_space, parent_configs):
+        """Generates a large offspring pool and keeps only the top_n candidates predicted by the surrogate."""
+        pool_configs, pool_ids = self.generate_offspring_by_cro_mut(parent_perfs, config_space, parent_configs,
+                                                                    self.pop_size * self.surrogate_pool_factor)
+        if not pool_configs:
+            return pool_configs, pool_ids
+        predicted = self.surrogate.predict(pool_configs)
 
-            parent1_idx = self.tournament_selection(parent_perfs)
-            parent2_idx = self.tournament_selection(parent_perfs)
+        if self.optimization_goal == 'minimum':
+            ranked = np.argsort(predicted)[:self.surrogate_top_n]
+        else:
+            ranked = np.argsort(predicted)[::-1][:self.surrogate_top_n]
 
-            while parent1_idx == parent2_idx:
-                parent2_idx = self.tournament_selection(parent_perfs)
+        self.surrogate_stats["screened"] += len(pool_configs)
+        self.surrogate_stats["simulated"] += len(ranked)
+        self.surrogate_stats["saved"] += self.pop_size - len(ranked)
 
-            parent1 = parent_configs[parent1_idx]
-            parent2 = parent_configs[parent2_idx]
+        return [pool_configs[k] for k in ranked], [pool_ids[k] for k in ranked]
 
-            child1, child2 = self.crossover(parent1, parent2)
-            child1 = self.mutate(child1, config_space)
-            child2 = self.mutate(child2, config_space)
+    def generate_offspring_by_cro_mut(self, parent_perfs, config_space, parent_configs, n_offspring=None):
+        # CHANGED: Tournament, crossover and mutation run on whole NumPy batches of parent pairs,
+        # novelty is checked against hashed sets instead of linear scans over the evaluated archive
+        n_offspring = self.pop_size if n_offspring is None else n_offspring
+        parent_configs = np.asarray(parent_configs)
+        parent_perfs = np.asarray(parent_perfs)
+        config_space = np.asarray(config_space)
 
-            # distribute id for new generated offspring
-            matches = np.where((config_space == child1).all(axis=1))[0]
-            child1_idx = matches[0] if matches.size > 0 else -1
-            matches = np.where((config_space == child2).all(axis=1))[0]
-            child2_idx = matches[0] if matches.size > 0 else -1
+        # distribute id for new generated offspring (-1 if the config is not a row of config_space)
+        config_to_id = {}
+        for row_id, row in enumerate(config_space.tolist()):
+            config_to_id.setdefault(tuple(row), row_id)
 
-            if self.is_valid_offspring(child1, parent_configs, offspring_configs):
-                offspring_configs.append(child1)
-                offspring_ids.append(child1_idx)
-            if len(offspring_configs) < self.pop_size and self.is_valid_offspring(child2, parent_configs, offspring_configs):
-                offspring_configs.append(child2)
-                offspring_ids.append(child2_idx)
+        # Parents, evaluated configs and accepted offspring are all excluded, the (large) evaluated set is
+        # only probed, never copied
+        parent_keys = set(map(tuple, parent_configs.tolist()))
+        offspring_keys = set()
+
+        offspring_configs = []
+        offspring_ids = []
+        barren_batches = 0
+        while len(offspring_configs) < n_offspring and barren_batches < 100:
+            n_pairs = n_offspring - len(offspring_configs)
+
+            parent1_idx, parent2_idx = self.batched_tournament_selection(parent_perfs, n_pairs)
+            children = self.batched_crossover(parent_configs[parent1_idx], parent_configs[parent2_idx])
+            children = self.batched_mutate(children, config_space)
+
+            accepted = len(offspring_configs)
+            for child in children.tolist():
+                key = tuple(child)
+                if key in parent_keys or key in self.evaluated_keys or key in offspring_keys:
+                    continue
+                offspring_keys.add(key)
+                offspring_configs.append(np.array(child))
+                offspring_ids.append(config_to_id.get(key, -1))
+                if len(offspring_configs) == n_offspring:
+                    break
+
+            # Guard against a (nearly) exhausted config space
+            barren_batches = barren_batches + 1 if len(offspring_configs) == accepted else 0
 
         return offspring_configs, offspring_ids
 
-    def tournament_selection(self, performance):
+    def batched_tournament_selection(self, performance, n_pairs):
+        """Binary tournaments for n_pairs parent pairs, the two parents of a pair are always different."""
+        parent1_idx = self._batched_tournament(performance, n_pairs)
+        parent2_idx = self._batched_tournament(performance, n_pairs)
+
+        same = parent1_idx == parent2_idx
+        while same.any():
+            parent2_idx[same] = self._batched_tournament(performance, int(same.sum()))
+            same = parent1_idx == parent2_idx
+
+        return parent1_idx, parent2_idx
+
+    def _batched_tournament(self, performance, size):
+        n = len(performance)
+        # Two distinct random candidates per tournament
+        first = np.random.randint(n, size=size)
+        second = (first + np.random.randint(1, n, size=size)) % n
 
-        candidates = np.random.choice(len(performance), 2, replace=False)
         if self.optimization_goal == 'minimum':
-            winner_idx = candidates[0] if performance[candidates[0]] < performance[candidates[1]] else candidates[1]
+            first_wins = performance[first] < performance[second]
         else:
-            winner_idx = candidates[0] if performance[candidates[0]] > performance[candidates[1]] else candidates[1]
-        return winner_idx
-
-    def crossover(self, parent1, parent2):
-        # single point crossover
-        if np.random.rand() < self.crossover_rate:
-            cross_point = np.random.randint(1, len(parent1))
-            child1 = np.concatenate((parent1[:cross_point], parent2[cross_point:]))
-            child2 = np.concatenate((parent2[:cross_point], parent1[cross_point:]))
+            first_wins = performance[first] > performance[second]
+        return np.where(first_wins, first, second)
+
+    def batched_crossover(self, parents1, parents2):
+        """Single point crossover per pair, returns the children interleaved as [c1, c2, c1, c2, ...]."""
+        n_pairs, n_genes = parents1.shape
+        if n_genes > 1:
+            cross_points = np.random.randint(1, n_genes, size=n_pairs)
         else:
-            child1, child2 = parent1.copy(), parent2.copy()
-        return child1, child2
-
-    def mutate(self, individual, config_space):
-        for i in range(len(individual)):
-            if np.random.rand() < self.mutation_rate:
-                low = int(config_space[i][0])
-                high = int(config_space[i][1])
-                individual[i] = np.random.randint(low, high + 1)
-
-        return individual
-
-    def is_valid_offspring(self, offspring_config, population_configs, offspring_configs):
-        # validated examination
-        is_not_in_population = not any(
-            np.array_equal(offspring_config, parent_config) for parent_config in population_configs)
-        is_not_evaluated = not any(
-            np.array_equal(offspring_config, evaluated_config) for evaluated_config in self.evaluated_configs)
-        is_not_in_offspring = not any(
-            np.array_equal(offspring_config, other_offspring_config) for other_offspring_config in offspring_configs)
-
-        return is_not_in_population and is_not_evaluated and is_not_in_offspring
+            cross_points = np.ones(n_pairs, dtype=int)
+        # Pairs that skip crossover keep all genes of their own parent
+        cross_points[np.random.rand(n_pairs) >= self.crossover_rate] = n_genes
+
+        from_own_parent = np.arange(n_genes)[None, :] < cross_points[:, None]
+        children = np.empty((2 * n_pairs, n_genes), dtype=parents1.dtype)
+        children[0::2] = np.where(from_own_parent, parents1, parents2)
+        children[1::2] = np.where(from_own_parent, parents2, parents1)
+        return children
+
+    def batched_mutate(self, children, config_space):
+        low = config_space[:children.shape[1], 0].astype(int)
+        high = config_space[:children.shape[1], 1].astype(int)
+
+        mutated = np.random.rand(*children.shape) < self.mutation_rate
+        random_genes = np.random.randint(low, high + 1, size=children.shape)
+        return np.where(mutated, random_genes, children)
 
     def find_nearest_neighbors(self, index, population, k):
         distances = cdist([population[index]], population)[0]
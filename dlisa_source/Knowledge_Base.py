@@ -0,0 +1,83 @@
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+
+class KnowledgeBase:
+    """
+    Persistent DLiSA memory: optimized populations, evaluated config->perf maps and similarity
+    scores survive restarts, so seeding can warm-start from earlier runs.
+    Backed by a single SQLite file, rows are keyed by workload label and bounded in number.
+    """
+
+    def __init__(self, path, max_results_per_workload=20, max_results=500):
+        self.path = path
+        self.max_results_per_workload = max_results_per_workload
+        self.max_results = max_results
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS workload_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                workload TEXT NOT NULL,
+                created REAL NOT NULL,
+                pop_configs TEXT NOT NULL,
+                pop_perfs TEXT NOT NULL,
+                evaluated TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_workload_results_workload ON workload_results (workload, id);
+            CREATE TABLE IF NOT EXISTS similarity (
+                workload TEXT PRIMARY KEY,
+                score REAL NOT NULL
+            );
+        """)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def add_result(self, workload, population_configs, population_perfs, evaluated_configs_map):
+        evaluated = [[[int(v) for v in config], float(perf)] for config, perf in evaluated_configs_map.items()]
+        self.db.execute(
+            "INSERT INTO workload_results (workload, created, pop_configs, pop_perfs, evaluated) VALUES (?, ?, ?, ?, ?)",
+            (workload, time.time(), json.dumps(np.asarray(population_configs).tolist()),
+             json.dumps(np.asarray(population_perfs, dtype=float).tolist()), json.dumps(evaluated)))
+        self._apply_retention(workload)
+        self.db.commit()
+
+    def _apply_retention(self, workload):
+        # Keep only the newest rows of this workload, then the newest rows overall
+        self.db.execute(
+            "DELETE FROM workload_results WHERE workload = ? AND id NOT IN "
+            "(SELECT id FROM workload_results WHERE workload = ? ORDER BY id DESC LIMIT ?)",
+            (workload, workload, self.max_results_per_workload))
+        self.db.execute(
+            "DELETE FROM workload_results WHERE id NOT IN "
+            "(SELECT id FROM workload_results ORDER BY id DESC LIMIT ?)",
+            (self.max_results,))
+
+    def load_results(self):
+        """All stored results, oldest first, as dicts with numpy populations and a tuple-keyed evaluated map."""
+        results = []
+        rows = self.db.execute(
+            "SELECT workload, pop_configs, pop_perfs, evaluated FROM workload_results ORDER BY id")
+        for workload, pop_configs, pop_perfs, evaluated in rows:
+            results.append({
+                "workload": workload,
+                "population_configs": np.array(json.loads(pop_configs)),
+                "population_perfs": np.array(json.loads(pop_perfs)),
+                "evaluated_configs_map": {tuple(config): perf for config, perf in json.loads(evaluated)},
+            })
+        return results
+
+    def set_similarity(self, workload, score):
+        self.db.execute("INSERT OR REPLACE INTO similarity (workload, score) VALUES (?, ?)", (workload, float(score)))
+        self.db.commit()
+
+    def load_similarity(self):
+        return {workload: score for workload, score in self.db.execute("SELECT workload, score FROM similarity")}
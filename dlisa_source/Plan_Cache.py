@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class PlanCache:
+    """
+    Workload label -> last optimized plan (winner and its population).
+    A recurring workload can then be answered instantly with the stored winner instead of a full twin GA run.
+
+    Policy:
+    - max_age: a plan older than this many simulation steps is stale (None = never stale).
+    - min_confidence: number of optimizations that must have produced/refined the plan before it is trusted.
+    """
+
+    def __init__(self, optimization_goal="minimum", max_age=None, min_confidence=1):
+        self.optimization_goal = optimization_goal
+        self.max_age = max_age
+        self.min_confidence = min_confidence
+        self.plans = {}
+        self.hits = 0
+        self.misses = 0
+
+    def store(self, workload, population_configs, population_perfs, time_step):
+        population_perfs = np.asarray(population_perfs)
+        if self.optimization_goal == 'minimum':
+            best_idx = int(np.argmin(population_perfs))
+        else:
+            best_idx = int(np.argmax(population_perfs))
+
+        previous = self.plans.get(workload)
+        self.plans[workload] = {
+            "config": np.array(population_configs[best_idx]),
+            "perf": float(population_perfs[best_idx]),
+            "population_configs": np.array(population_configs),
+            "population_perfs": population_perfs,
+            "stored_at": time_step,
+            "confidence": 1 if previous is None else previous["confidence"] + 1,
+        }
+
+    def is_fresh(self, plan, time_step):
+        if self.max_age is not None and time_step - plan["stored_at"] > self.max_age:
+            return False
+        return plan["confidence"] >= self.min_confidence
+
+    def lookup(self, workload, time_step, count_miss=True):
+        """
+        Returns the stored plan if it satisfies the freshness/confidence policy, None otherwise.
+        count_miss=False is for lookups where a miss cannot start an optimization anyway.
+        """
+        plan = self.plans.get(workload)
+        if plan is None or not self.is_fresh(plan, time_step):
+            if count_miss:
+                self.misses += 1
+            return None
+        self.hits += 1
+        return plan
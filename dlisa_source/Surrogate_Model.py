@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class SurrogateModel:
+    """
+    Gaussian kernel regression (Nadaraya-Watson) over the bounded config space.
+    Cheap enough to score hundreds of candidate configs per generation, it is only used
+    to rank offspring before they are sent to the twin, never as a fitness value.
+    """
+
+    def __init__(self, bounds, bandwidth=0.1, min_samples=5):
+        bounds = np.array(bounds, dtype=float)
+        self.low = bounds[:, 0]
+        span = bounds[:, 1] - bounds[:, 0]
+        self.span = np.where(span > 0, span, 1.0)
+        # Bandwidth in normalized [0, 1] units of each dimension
+        self.bandwidth = bandwidth
+        self.min_samples = min_samples
+
+        self.train_configs = None
+        self.train_perfs = None
+
+    def _scale(self, configs):
+        return (np.array(configs, dtype=float) - self.low) / self.span
+
+    @property
+    def is_ready(self):
+        return self.train_perfs is not None and len(self.train_perfs) >= self.min_samples
+
+    def fit(self, configs_to_perfs):
+        """Trains on a {config tuple: perf} mapping."""
+        if not configs_to_perfs:
+            self.train_configs = None
+            self.train_perfs = None
+            return self
+
+        self.train_configs = self._scale(list(configs_to_perfs.keys()))
+        self.train_perfs = np.array(list(configs_to_perfs.values()), dtype=float)
+        return self
+
+    def predict(self, configs):
+        query = self._scale(configs)
+        sq_dist = ((query[:, None, :] - self.train_configs[None, :, :]) ** 2).sum(axis=2)
+
+        # Shift by the nearest sample per row, so the weights never underflow to an all-zero row
+        sq_dist -= sq_dist.min(axis=1, keepdims=True)
+        weights = np.exp(-sq_dist / (2 * self.bandwidth ** 2))
+
+        return weights @ self.train_perfs / weights.sum(axis=1)
@@ -1,31 +1,97 @@
+import argparse
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import numpy as np
 
+from adapters.state_transfer import StateChannel
 from adapters.sumo_adapter import SumoAdapter
-from dlisa_bridge import SumoBridge
+from dlisa_bridge import LIGHTS_TIME_BOUNDS, MEASURE_STEPS, WARMUP_STEPS, SumoBridge, SumoBridgePool
 from dlisa_source.Adaptation_Optimizer import AdaptationOptimizer
 from dlisa_source.Genetic_Algorithm import GeneticAlgorithm
-from tools.workload_generator import build_random_cycling_timeline, generate_timeline_route_file
+from dlisa_source.Knowledge_Base import KnowledgeBase
+from dlisa_source.Plan_Cache import PlanCache
+from dlisa_source.Surrogate_Model import SurrogateModel
+from tools.workload_generator import Timeline, iter_random_cycling_timeline, write_timeline_routes
+from workload_detector import TRIGGER_POLICIES, WORKLOAD_LABELS, WorkloadDetector, build_trigger, classify_batch
 
 ###### Global definitions of configurable parameters
+### Execution mode (overridable from the command line)
+# - "paced": live and baseline runs in sumo-gui, paced to wall-clock time for demos
+# - "fast": headless, no GUI delay and no sleeps, for regression and capacity runs. Adaptations block the live loop,
+#   unpaced live steps would otherwise outrun the twins by a host-dependent amount and make runs irreproducible
+EXECUTION_MODES = ("paced", "fast")
+EXECUTION_MODE = "paced"
+PACED_GUI_DELAY = 1  # ms
+PACED_STEP_SLEEP = 0.01  # s
+###
 ### Timeline creation
 TIMELINE_SEGMENT_LENGTH = 200
 TIMELINE_CYCLE_COUNT = 1
+ROUTE_FILE = "traffic_env/routes.rou.xml"
+ROUTES_GZIP = False  # write the route file gzip-compressed (ROUTE_FILE + ".gz"), SUMO reads it as is
 ###
 ### Optimizer
 OPTIMIZER_MAX_GENERATION = 5
 OPTIMIZER_POPULATION_SIZE = 5
 OPTIMIZER_MUTATION_RATE = 0.1
 OPTIMIZER_CROSS_RATE = 0.8
+SURROGATE_SCREENING = False
+SURROGATE_POOL_FACTOR = 4
+SURROGATE_TOP_N = 3
+###
+### Persistent DLiSA memory (None disables it, e.g. "results/dlisa_knowledge.sqlite" or --knowledge-base)
+# The compare harness never uses it, so each DLiSA run there starts cold and stays independent
+KNOWLEDGE_BASE_PATH = None
+KNOWLEDGE_BASE_MAX_PER_WORKLOAD = 20
+KNOWLEDGE_BASE_MAX_RESULTS = 500
+###
+### Retention of the in-memory optimizer history (None = unbounded)
+HISTORY_MAX_ENVIRONMENTS = 50
+HISTORY_MAX_PER_LABEL = 10
+HISTORY_MAX_LABELS = None
+HISTORY_DECAY = 1.0  # < 1 makes older environments weigh less when seeding
+###
+### Per-workload plan cache
+PLAN_CACHE_ENABLED = True
+PLAN_CACHE_MAX_AGE = None  # in simulation steps, None = plans never expire
+PLAN_CACHE_MIN_CONFIDENCE = 1  # optimizations a plan needs before it is reused
+PLAN_CACHE_REFINE = True  # after a cache hit, refine the plan with a twin GA in the background
 ###
 ### Live simulation
 LIVE_START_CONFIG = [30, 30]
+TRIGGER_POLICY = "periodic"  # "periodic" (every CHECK_EVERY steps) or "change_point" (Page-Hinkley on cycle-averaged queues/volumes)
 CHECK_EVERY = 25
 MIN_STABLE_CLASSIFICATIONS = 6
 MIN_HALTED_CARS = 6
+DETECTOR_WINDOW = 5  # steps of halting/density states averaged before classifying
+###
+### Cyber-Twin
+TWIN_POOL_SIZE = 4
+TWIN_BASE_PORT = 9999
+TWIN_BACKEND = "traci"  # "traci" (one SUMO process per twin) or "libsumo" (in-process, single twin)
+TWIN_WAITING_MODE = "vehicle"  # "vehicle" (exact per-vehicle waiting time) or "halting" (lane halting counts)
+TWIN_MULTI_FIDELITY = False  # successive halving over dlisa_bridge.MULTI_FIDELITY_RUNGS
+# Candidate measurement: by default every candidate gets one full run from the live checkpoint. Racing offspring
+# against the worst parent (TWIN_EARLY_TERMINATION) and successive halving (TWIN_MULTI_FIDELITY) are opt-in: they
+# stop runs early, and those censored candidates are left out of the evaluated map that feeds the workload history,
+# the similarity of later environments and the knowledge base. Racing stops a single run early, so it is skipped
+# when TWIN_REPLICATES > 1 (or with TWIN_MULTI_FIDELITY); raise TWIN_REPLICATES for CI-stopped replicates instead.
+# Common random numbers are opt-in: each replicate's seeded state is derived once per adaptation by reloading a twin
+TWIN_COMMON_RANDOM_NUMBERS = False  # all candidates of an adaptation are measured on the same seeded traffic
+TWIN_REPLICATES = 1  # max seeded replicates per candidate, fewer once its confidence interval clears the incumbent
+TWIN_TRANSFER_PRIORS = True  # earlier results of a workload train the surrogate (never reused as fresh costs)
+TWIN_EARLY_TERMINATION = False  # stop measuring offspring that can no longer beat the worst parent (single replicate only)
+BACKGROUND_ADAPTATION = True
+DISCARD_STALE_ADAPTATIONS = True
+CHECKPOINT_ROOT = None  # directory of the checkpoint store shared by the twins, None = tmpfs (/dev/shm) when available, else the system temp directory
+CHECKPOINT_FORMAT = "binary"  # "binary" (.sbx), "xml" or "xml.gz"
+# Twins on other hosts, added to the local pool: {"host", "port", "state_port", "state_root"}. Each host runs
+# SUMO with --remote-port <port> and the state server (python -m adapters.state_transfer --port <state_port>
+# --root <state_root>), the live state is shipped to it as bytes
+TWIN_REMOTE = []
 ###
 ######
 
@@ -83,92 +149,140 @@ def classify_workload(halting_state, density_state, queue_threshold=10, flow_rat
 
     halting_state: [qN, qS, qE, qW] - Cars actually stopped.
     density_state: [tN, tS, tE, tW] - Total cars on the lane.
+
+    Single-snapshot form of workload_detector.classify_batch, which holds the classification rules.
     """
-    # Unpack
-    q_ns1, q_ns2, q_ew1, q_ew2 = halting_state
-    t_ns1, t_ns2, t_ew1, t_ew2 = density_state
-
-    # 1. Calculate Queue Severity (The "Pain")
-    ns_queue = q_ns1 + q_ns2
-    ew_queue = q_ew1 + q_ew2
-
-    # 2. Calculate Total Demand (The "Volume")
-    ns_volume = t_ns1 + t_ns2
-    ew_volume = t_ew1 + t_ew2
-
-    # 3. Determine Load Status based on Queues (Priority to stopped cars)
-    ns_is_critical = ns_queue > queue_threshold
-    ew_is_critical = ew_queue > queue_threshold
-
-    # --- CLASSIFICATION LOGIC ---
-
-    # CASE A: Saturation (Gridlock)
-    # Both sides are critical.
-    # OR: One side is critical, and the other has high moving volume (approaching saturation).
-    if (ns_is_critical and ew_is_critical) or \
-            (ns_is_critical and ew_volume > queue_threshold) or \
-            (ew_is_critical and ns_volume > queue_threshold):
-        return "Saturated", 1.0, ns_queue, ew_queue
-
-    # CASE B: Directional Heaviness (Critical Queues)
-    if ns_is_critical:
-        ratio = ns_queue / max(1, ew_queue)
-        return "NS_Heavy", ratio, ns_queue, ew_queue
-
-    if ew_is_critical:
-        ratio = ew_queue / max(1, ns_queue)
-        return "EW_Heavy", ratio, ns_queue, ew_queue
-
-    # CASE C: High Flow, Low Queue (The "Green Wave" Scenario)
-    # Cars are moving but not stopping. We shouldn't label this "Light".
-    # We check Volume Ratios.
-    if ns_volume > queue_threshold or ew_volume > queue_threshold:
-        # If queues are low but volume is high, use Volume Ratio
-        vol_ratio = ns_volume / max(1, ew_volume)
-        if vol_ratio >= flow_ratio_threshold:
-            return "NS_Flow", vol_ratio, ns_volume, ew_volume
-        elif vol_ratio <= (1 / flow_ratio_threshold):
-            tmp = (1 / vol_ratio) if vol_ratio != 0 else 1
-            return "EW_Flow", tmp, ns_volume, ew_volume
-        else:
-            return "High_Volume_Balanced", 1.0, ns_volume, ew_volume
-
-    # CASE D: Ghost Town (Low Queue, Low Volume)
-    return "Light_Balanced", 1.0, ns_queue, ew_queue
-
-
-def optimize_in_twin(live_optimizer, workload_label, initial_population, initial_ids, twin_bridge, cp_file):
+    codes, ratios, ns_values, ew_values = classify_batch([halting_state], [density_state], queue_threshold,
+                                                         flow_ratio_threshold)
+    return WORKLOAD_LABELS[codes[0]], float(ratios[0]), ns_values[0], ew_values[0]
+
+
+def optimize_in_twin(live_optimizer, workload_label, initial_population, initial_ids, twin_bridge, checkpoint):
     """
     Runs the Genetic Algorithm inside the Cyber-Twin
     """
-    # Setup Twin Environment
-    # TODO: Seed?
-    twin_bridge.adapter.start(seed=42)  # Deterministic for fairness
-    twin_bridge.checkpoint = cp_file
+    # Setup Twin Environment - the twins are already running, they only need to be healthy
+    twin_bridge.ensure_healthy()
 
-    # Run Evolution
+    # Cached perfs are only reused within this adaptation, older ones can only act as surrogate priors
     ga = live_optimizer.ga_worker
+    ga.begin_evaluation_scope(workload_label, checkpoint)
 
-    final_pop, final_perfs, final_ids, evaluated_map = ga.run(
-        init_pop_config=initial_population,
-        init_pop_config_ids=initial_ids,
-        config_space=twin_bridge.bounds,
-        perf_space=None,
-        max_generation=live_optimizer.max_generation,
-        bridge=twin_bridge
-    )
+    # Run Evolution
+    # Earlier results of the same workload help the surrogate (if any) rank offspring
+    prior_maps = [evaluated for name, evaluated in
+                  zip(live_optimizer.his_envs_name, live_optimizer.his_evaluated_configs_to_perfs)
+                  if name == workload_label]
 
-    twin_bridge.adapter.close()
+    try:
+        final_pop, final_perfs, final_ids, evaluated_map = ga.run(
+            init_pop_config=initial_population,
+            init_pop_config_ids=initial_ids,
+            config_space=twin_bridge.bounds,
+            perf_space=None,
+            max_generation=live_optimizer.max_generation,
+            bridge=twin_bridge,
+            prior_configs_to_perfs=prior_maps
+        )
+    finally:
+        twin_bridge.release_checkpoint(checkpoint)
+
+    if ga.surrogate is not None:
+        print(f"   [DLiSA] Surrogate screening: {ga.surrogate_stats}")
 
     # Return results for DLiSA memory
     return final_pop, final_perfs, evaluated_map
 
 
+def launch_adaptation(executor, live_optimizer, workload_label, initial_population, initial_ids, live_bridge,
+                      twin_bridge, time_step, log=True):
+    """
+    Snapshots the live simulation and submits the twin GA to the background executor.
+    Returns the pending adaptation handle (workload, start step and future).
+    """
+    # Every adaptation gets its own checkpoint name in the twins' shared store, saved once from the live state
+    checkpoint = f"adaptation_{os.getpid()}_{time_step}"
+    report = twin_bridge.take_checkpoint(live_bridge.adapter, checkpoint)
+    if log: print(f"   [DLiSA] Live checkpoint: {report['bytes'] / 1024:.1f} KiB saved in {report['seconds'] * 1000:.1f} ms")
+    if log and report["shipped_bytes"]:
+        print(f"   [DLiSA] Live checkpoint shipped to remote twins: {report['shipped_bytes'] / 1024:.1f} KiB "
+              f"in {report['ship_seconds'] * 1000:.1f} ms")
+
+    return {
+        "workload": workload_label,
+        "started_at": time_step,
+        "future": executor.submit(
+            optimize_in_twin, live_optimizer, workload_label, initial_population, initial_ids,
+            twin_bridge, checkpoint
+        ),
+    }
+
+
+def route_file_path():
+    return ROUTE_FILE + ".gz" if ROUTES_GZIP else ROUTE_FILE
+
+
+def generate_cycling_timeline(n_cycles, seed):
+    """
+    Streams a random cycling timeline into the route file one segment at a time, and returns it
+    as a Timeline (the ground truth the monitor looks the real workload up in).
+    """
+    timeline = Timeline()
+
+    def recorded(segments):
+        for seg in segments:
+            timeline.append(seg["name"], seg["begin"], seg["end"])
+            yield seg
+
+    n_segments = write_timeline_routes(recorded(iter_random_cycling_timeline(TIMELINE_SEGMENT_LENGTH, n_cycles, seed)),
+                                       route_file_path())
+    print(f"--> Generated TIMELINE routes file with {n_segments} segments: {route_file_path()}")
+    return timeline
+
+
+def simulation_end(timeline):
+    """SUMO end time covering the timeline plus one twin evaluation started at its last step."""
+    return timeline[-1]["end"] + 1 + WARMUP_STEPS + MEASURE_STEPS
+
+
+def build_twin_pool(size=TWIN_POOL_SIZE, base_port=TWIN_BASE_PORT, backend=TWIN_BACKEND, waiting_mode=TWIN_WAITING_MODE,
+                    route_file=None, end=None, remote=TWIN_REMOTE):
+    """
+    Creates K headless twins, each one with its own TraCI label and port, plus the remote twins.
+    """
+    if backend == "libsumo" and size > 1:
+        # libsumo can only host one simulation per process
+        print(f"[DLiSA] libsumo backend supports a single twin, reducing pool size from {size} to 1")
+        size = 1
+
+    # Twins save RNG states, so seeded replicate checkpoints replay the same traffic for every candidate
+    twins = [SumoAdapter(gui=False, label=f"twin_{k}", port=base_port + k, backend=backend, waiting_mode=waiting_mode,
+                         save_rng=True, route_file=route_file, end=end)
+             for k in range(size)]
+    twins += [SumoAdapter(gui=False, label=f"remote_{k}", port=spec["port"], backend="traci", waiting_mode=waiting_mode,
+                          save_rng=True, route_file=route_file, end=end, host=spec["host"],
+                          state_channel=StateChannel(spec["host"], spec["state_port"], spec["state_root"]))
+              for k, spec in enumerate(remote)]
+    return SumoBridgePool(twins, checkpoint_root=CHECKPOINT_ROOT, state_format=CHECKPOINT_FORMAT)
+
+
+def execution_settings(mode):
+    """(gui, gui delay, sleep per live step, background adaptation) of an execution mode."""
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode: {mode}")
+    if mode == "fast":
+        return False, None, 0.0, False
+    return True, PACED_GUI_DELAY, PACED_STEP_SLEEP, BACKGROUND_ADAPTATION
+
+
 def get_actual_workload_label(timeline, current_time_step):
     """
     Finds the ground truth workload label for a specific time step
     based on the generated timeline.
     """
+    if isinstance(timeline, Timeline):
+        return timeline.label_at(current_time_step)
+
     for segment in timeline:
         # Check if the current time falls within this segment's window
         if segment["begin"] <= current_time_step < segment["end"]:
@@ -177,15 +291,23 @@ def get_actual_workload_label(timeline, current_time_step):
     return "Unknown"  # Should not happen
 
 
-def run_cyber_twin_demo(timeline=None, log=True):
+def run_cyber_twin_demo(timeline=None, log=True, mode=EXECUTION_MODE, trigger_policy=TRIGGER_POLICY,
+                        knowledge_base_path=KNOWLEDGE_BASE_PATH):
     # Set up a random timeline of scenarios
     if timeline is None:
         # TODO: Seed?
-        timeline = build_random_cycling_timeline(segment_len=TIMELINE_SEGMENT_LENGTH, n_cycles=TIMELINE_CYCLE_COUNT, seed=42)
-        generate_timeline_route_file(timeline)
+        timeline = generate_cycling_timeline(TIMELINE_CYCLE_COUNT, seed=42)
+    elif not isinstance(timeline, Timeline):
+        # Indexed once, the monitor looks up the real workload every step
+        timeline = Timeline(timeline)
 
     end_time = timeline[-1]["end"]
 
+    knowledge_base = None
+    if knowledge_base_path is not None:
+        knowledge_base = KnowledgeBase(knowledge_base_path, max_results_per_workload=KNOWLEDGE_BASE_MAX_PER_WORKLOAD,
+                                       max_results=KNOWLEDGE_BASE_MAX_RESULTS)
+
     live_optimizer = AdaptationOptimizer(
         max_generation=OPTIMIZER_MAX_GENERATION,
         pop_size=OPTIMIZER_POPULATION_SIZE,
@@ -193,26 +315,65 @@ def run_cyber_twin_demo(timeline=None, log=True):
         crossover_rate=OPTIMIZER_CROSS_RATE,
         compared_algorithms=["DLiSA"],
         system="TrafficLights",  # Not really used, we pass bridge manually
-        optimization_goal="minimum"
+        optimization_goal="minimum",
+        knowledge_base=knowledge_base,
+        config_bounds=LIGHTS_TIME_BOUNDS,
+        max_environments=HISTORY_MAX_ENVIRONMENTS,
+        max_environments_per_label=HISTORY_MAX_PER_LABEL,
+        max_labels=HISTORY_MAX_LABELS,
+        history_decay=HISTORY_DECAY
     )
 
     # Attach a GA worker to the live_optimizer for convenience
-    live_optimizer.ga_worker = GeneticAlgorithm(5, 0.1, 0.8, "minimum")
+    surrogate = SurrogateModel(LIGHTS_TIME_BOUNDS) if SURROGATE_SCREENING else None
+    live_optimizer.ga_worker = GeneticAlgorithm(5, 0.1, 0.8, "minimum", surrogate=surrogate,
+                                                surrogate_pool_factor=SURROGATE_POOL_FACTOR,
+                                                surrogate_top_n=SURROGATE_TOP_N, bounds=LIGHTS_TIME_BOUNDS,
+                                                early_termination=TWIN_EARLY_TERMINATION,
+                                                transfer_priors=TWIN_TRANSFER_PRIORS)
 
     # Live Simulation Setup
-    live_sumo_simulation = SumoAdapter(gui=True, label="live", port=8813)
+    gui, gui_delay, step_sleep, background_adaptation = execution_settings(mode)
+    live_sumo_simulation = SumoAdapter(gui=gui, label="live", port=8813, delay=gui_delay, route_file=route_file_path(),
+                                       end=simulation_end(timeline))
     # TODO: Seed?
     live_sumo_simulation.start(seed=42)
     live_bridge = SumoBridge(live_sumo_simulation)
 
+    # Twins are started once and kept warm, every adaptation only re-loads a checkpoint
+    twin_pool = build_twin_pool(route_file=route_file_path(), end=simulation_end(timeline))
+    twin_pool.multi_fidelity = TWIN_MULTI_FIDELITY
+    twin_pool.common_random_numbers = TWIN_COMMON_RANDOM_NUMBERS
+    twin_pool.replicates = TWIN_REPLICATES
+    if TWIN_EARLY_TERMINATION and (TWIN_REPLICATES > 1 or TWIN_MULTI_FIDELITY):
+        print("[DLiSA] Early termination needs a single full-fidelity replicate, offspring are measured without racing")
+    # TODO: Seed?
+    twin_pool.start(seed=42)  # Deterministic for fairness
+
     crt_config = LIVE_START_CONFIG
     live_bridge.adapter.apply_configuration(crt_config[0], crt_config[1], log)
 
     # Detection Loop parameter initializations
     total_waiting_time = 0
     crt_workload = None
-    candidate_workload = None
-    stable = 0
+    detector = WorkloadDetector(n_streams=1, window=DETECTOR_WINDOW, min_stable=MIN_STABLE_CLASSIFICATIONS,
+                                min_halted=MIN_HALTED_CARS)
+    trigger = build_trigger(trigger_policy, check_every=CHECK_EVERY)
+    # Change points are searched over one signal cycle of the plan in use, every new plan restarts them
+    trigger.restart(live_sumo_simulation.cycle_length())
+    # Ground truth detection latency: steps from a real workload change to the adaptation it caused
+    real_workload = None
+    real_change_at = 0
+    trigger_latencies = []
+
+    plan_cache = None
+    if PLAN_CACHE_ENABLED:
+        plan_cache = PlanCache(optimization_goal="minimum", max_age=PLAN_CACHE_MAX_AGE,
+                               min_confidence=PLAN_CACHE_MIN_CONFIDENCE)
+
+    # The twin GA runs in a worker thread so the live loop keeps stepping meanwhile
+    adaptation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="adaptation")
+    pending_adaptation = None
 
     try:
         for t in range(end_time + 1):
@@ -220,91 +381,160 @@ def run_cyber_twin_demo(timeline=None, log=True):
 
             # Get current state - number of stopped vehicles and number of total vehicles
             halting_state, density_state = live_sumo_simulation.get_state()
-            # Classify current state (detect if workload changed)
-            detected_workload, ratio, ns_stopped, ew_stopped = classify_workload(halting_state, density_state)
-
-            # Stability logic
+            # Classify the smoothed state stream (detect if workload changed)
             # - do not change configuration if not sure that workload changed
             # - do not change configuration if too few cars are waiting
-            if (ns_stopped + ew_stopped) < MIN_HALTED_CARS and crt_workload is not None:
-                detected_workload = crt_workload
-
-            if detected_workload != candidate_workload:
-                candidate_workload = detected_workload
-                stable = 1
-            else:
-                stable += 1
+            detector.update([halting_state], [density_state])
+            detected_workload = detector.label(detector.detected[0])
+            candidate_workload = detector.label(detector.candidate[0])
 
+            previous_real_workload = real_workload
             real_workload = get_actual_workload_label(timeline, t)
+            if real_workload != previous_real_workload:
+                real_change_at = t
             if log: print(f"[MON] t={t} Real Workload={real_workload} Detected Workload={detected_workload} Config={crt_config} Halting state={halting_state} Density state={density_state}")
 
-            # New workload detected - optimize configuration
-            if t % CHECK_EVERY == 0 and stable >= MIN_STABLE_CLASSIFICATIONS and candidate_workload != crt_workload:
-                if log: print(f"\n[DLiSA] New Workload Detected: {candidate_workload}")
-
-                # Ask DLiSA for Initial Population (Seeding vs Random)
-                # We pass the bounds as 'config_space'
-                init_pop, init_ids = live_optimizer.generate_next_population(
-                    config_space=np.array(live_bridge.bounds),
-                    selected_algorithm='DLiSA',
-                    environment_name=candidate_workload
-                )
-
-                # Run Optimization in Cyber-Twin
-                cp_file = os.path.join(os.getcwd(), 'traffic_env/crt_live_cp.xml')
-                live_bridge.adapter.save_checkpoint(cp_file)
-
-                if log: print("   [DLiSA] Running Cyber-Twin Simulation...")
-                best_pop, best_perfs, eval_map = optimize_in_twin(
-                    live_optimizer, candidate_workload, init_pop, init_ids,
-                    SumoBridge(SumoAdapter(gui=False, label="twin", port=9999)), cp_file
-                )
+            # New workload detected - reuse a cached plan or optimize configuration
+            adapt_needed = detector.should_adapt()[0]
+            check_workload = trigger.update(t, halting_state, density_state, adapt_needed)
+            if check_workload and adapt_needed:
+                adapted = False
+                # While an optimization is pending a miss changes nothing, so it is not counted
+                cached_plan = None
+                if plan_cache is not None:
+                    cached_plan = plan_cache.lookup(candidate_workload, t, count_miss=pending_adaptation is None)
+
+                if cached_plan is not None:
+                    # Recurring workload - apply the stored winner right away, no twin runs needed
+                    winner = cached_plan["config"]
+                    if log: print(f"\n[DLiSA] Recurring Workload Detected: {candidate_workload}. Applying cached plan: {winner}")
+                    live_bridge.adapter.apply_configuration(winner[0], winner[1], log)
+                    trigger.restart(live_sumo_simulation.cycle_length())
+
+                    crt_config = winner
+                    crt_workload = candidate_workload
+                    detector.confirm(crt_workload)
+                    adapted = True
+
+                    if PLAN_CACHE_REFINE and pending_adaptation is None:
+                        if log: print("   [DLiSA] Refining cached plan in the Cyber-Twin...")
+                        refine_pop = cached_plan["population_configs"]
+                        pending_adaptation = launch_adaptation(
+                            adaptation_executor, live_optimizer, candidate_workload, refine_pop,
+                            np.array([hash(tuple(c)) for c in refine_pop]), live_bridge, twin_pool, t, log
+                        )
+
+                elif pending_adaptation is None:
+                    if log: print(f"\n[DLiSA] New Workload Detected: {candidate_workload}")
+
+                    # Ask DLiSA for Initial Population (Seeding vs Random)
+                    # We pass the bounds as 'config_space'
+                    init_pop, init_ids = live_optimizer.generate_next_population(
+                        config_space=np.array(live_bridge.bounds),
+                        selected_algorithm='DLiSA',
+                        environment_name=candidate_workload
+                    )
+
+                    if log: print("   [DLiSA] Running Cyber-Twin Simulation...")
+                    pending_adaptation = launch_adaptation(
+                        adaptation_executor, live_optimizer, candidate_workload, init_pop, init_ids,
+                        live_bridge, twin_pool, t, log
+                    )
+                    adapted = True
+
+                if adapted:
+                    trigger.record_adaptation(t)
+                    trigger_latencies.append(t - real_change_at)
+                    if log: print(f"   [Trigger] {trigger_policy} adaptation {t - real_change_at} steps after the workload change")
+
+                # Blocking mode: wait here so the result is applied in this very step
+                if pending_adaptation is not None and not background_adaptation:
+                    wait([pending_adaptation["future"]])
+
+            finished_adaptation = None
+            if pending_adaptation is not None and pending_adaptation["future"].done():
+                finished_adaptation = pending_adaptation
+                pending_adaptation = None
+
+                # A failed twin run must not stop the live controller: log it and keep the current plan
+                adaptation_error = finished_adaptation["future"].exception()
+                if adaptation_error is not None:
+                    print(f"   [DLiSA] Adaptation for {finished_adaptation['workload']} failed, keeping {crt_config}: "
+                          f"{adaptation_error!r}")
+                    finished_adaptation = None
+
+            # A background adaptation finished - learn from it and apply the winner
+            if finished_adaptation is not None:
+                adaptation_workload = finished_adaptation["workload"]
+                adaptation_steps = t - finished_adaptation["started_at"]
+                best_pop, best_perfs, eval_map = finished_adaptation["future"].result()
 
                 # Register Results (Learning)
                 live_optimizer.register_workload_result(
-                    environment_name=candidate_workload,
+                    environment_name=adaptation_workload,
                     population_configs=best_pop,
                     population_perfs=best_perfs,
                     evaluated_configs_map=eval_map
                 )
+                if plan_cache is not None:
+                    plan_cache.store(adaptation_workload, best_pop, best_perfs, t)
 
-                # Apply Winner to Live System
+                # Apply Winner to Live System, unless the workload moved on while the twin was running
                 best_idx = np.argmin(best_perfs)
                 winner = best_pop[best_idx]
-                if log: print(f"   [DLiSA] Optimization Done. Applying: {winner}")
-                live_bridge.adapter.apply_configuration(winner[0], winner[1], log)
+                if DISCARD_STALE_ADAPTATIONS and candidate_workload != adaptation_workload:
+                    if log: print(f"   [DLiSA] Optimization Done for stale workload {adaptation_workload} (now {candidate_workload}). Discarding: {winner}")
+                else:
+                    if log: print(f"   [DLiSA] Optimization Done after {adaptation_steps} live steps. Applying: {winner}")
+                    live_bridge.adapter.apply_configuration(winner[0], winner[1], log)
+                    trigger.restart(live_sumo_simulation.cycle_length())
 
-                crt_config = winner
-                crt_workload = candidate_workload
+                    crt_config = winner
+                    crt_workload = adaptation_workload
+                    detector.confirm(crt_workload)
 
             if t % 100 == 0:
                 print(f"[DLiSA] t={t} Cumulative Wait={total_waiting_time:.2f}")
 
-            time.sleep(0.01)
+            if step_sleep:
+                time.sleep(step_sleep)
             total_waiting_time += live_sumo_simulation.get_delta_waiting_time_step()
     finally:
+        # Let a running twin GA finish before its SUMO instances are closed
+        adaptation_executor.shutdown(wait=True)
+        twin_pool.close()
+        if knowledge_base is not None:
+            knowledge_base.close()
         if log: print(f"--- DLiSA FINISHED ---")
+        if log and plan_cache is not None: print(f"Plan cache hits: {plan_cache.hits}, misses: {plan_cache.misses}")
+        if log and trigger_latencies: print(f"Trigger ({trigger_policy}): {len(trigger_latencies)} adaptations, "
+                                            f"{len(trigger.events)} change events, "
+                                            f"mean latency {np.mean(trigger_latencies):.1f} steps")
+        # Change-point policies also report how long a detected change waited for its adaptation
+        event_latencies = trigger.latencies()
+        if log and event_latencies: print(f"Trigger ({trigger_policy}): {len(event_latencies)} change events adapted, "
+                                          f"mean {np.mean(event_latencies):.1f} steps from event to adaptation")
         if log: print(f"Final Total Waiting Time: {total_waiting_time}")
         live_sumo_simulation.close()
 
     return total_waiting_time
 
 
-def run_fixed_control_baseline(timeline=None):
+def run_fixed_control_baseline(timeline=None, mode=EXECUTION_MODE):
     """
     Runs the simulation with a fixed, static traffic light program.
     Used to compare against DLiSA.
     """
     if timeline is None:
         # TODO: Seed?
-        timeline = build_random_cycling_timeline(segment_len=TIMELINE_SEGMENT_LENGTH, n_cycles=TIMELINE_CYCLE_COUNT,
-                                                 seed=42)
-        generate_timeline_route_file(timeline)
+        timeline = generate_cycling_timeline(TIMELINE_CYCLE_COUNT, seed=42)
 
     end_time = timeline[-1]["end"]
 
     # Setup Simulation
-    sim = SumoAdapter(gui=True, label="baseline", port=9998)
+    gui, gui_delay, _, _ = execution_settings(mode)
+    sim = SumoAdapter(gui=gui, label="baseline", port=9998, delay=gui_delay, route_file=route_file_path(),
+                      end=simulation_end(timeline))
     sim.start(seed=42)
 
     # Apply Fixed Configuration (Standard Static Program)
@@ -340,7 +570,18 @@ if __name__ == "__main__":
     else:
         sys.exit("please declare environment variable 'SUMO_HOME'")
 
-    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+    parser = argparse.ArgumentParser(description="DLiSA Cyber-Twin traffic light adaptation")
+    parser.add_argument("command", nargs="?", choices=["demo", "compare"], default="demo")
+    parser.add_argument("--mode", choices=EXECUTION_MODES, default=EXECUTION_MODE,
+                        help="'fast' runs headless without GUI delay or sleeps, 'paced' is the GUI demo")
+    parser.add_argument("--trigger", choices=TRIGGER_POLICIES, default=TRIGGER_POLICY,
+                        help="when to look for a new workload: every CHECK_EVERY steps or on detected change points")
+    parser.add_argument("--knowledge-base", default=KNOWLEDGE_BASE_PATH,
+                        help="SQLite file to warm-start DLiSA from and save results to (demo only)")
+    parser.add_argument("--quiet", action="store_true", help="disable the per-step monitor log")
+    args = parser.parse_args()
+
+    if args.command == 'compare':
         # Init timeline once
 
         num_iterations = 6
@@ -352,11 +593,11 @@ if __name__ == "__main__":
             results[j] = {}
             TIMELINE_CYCLE_COUNT = 1
             for i in range(num_iterations):
-                timeline = build_random_cycling_timeline(segment_len=TIMELINE_SEGMENT_LENGTH, n_cycles=TIMELINE_CYCLE_COUNT, seed=42)
-                generate_timeline_route_file(timeline)
+                timeline = generate_cycling_timeline(TIMELINE_CYCLE_COUNT, seed=42)
 
-                cost_control = run_fixed_control_baseline(timeline)
-                cost_dlisa = run_cyber_twin_demo(timeline, True)
+                cost_control = run_fixed_control_baseline(timeline, mode=args.mode)
+                cost_dlisa = run_cyber_twin_demo(timeline, not args.quiet, mode=args.mode, trigger_policy=args.trigger,
+                                                 knowledge_base_path=None)
 
                 results[j][i+1] = cost_control, cost_dlisa
 
@@ -364,4 +605,5 @@ if __name__ == "__main__":
                 print(f"results: {results}")
 
     else:
-        run_cyber_twin_demo()
+        run_cyber_twin_demo(log=not args.quiet, mode=args.mode, trigger_policy=args.trigger,
+                            knowledge_base_path=args.knowledge_base)
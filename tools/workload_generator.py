@@ -1,5 +1,9 @@
+import gzip
 import os
 import random
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
 
 SCENARIO_MAP = {
     "NS_Heavy": (0.5, 0.05),
@@ -8,65 +12,137 @@ SCENARIO_MAP = {
 }
 
 
-def generate_timeline_route_file(timeline, output_path="traffic_env/routes.rou.xml"):
-    """
-    Writes multiple flows with begin/end windows so traffic changes dynamically over time.
+class Timeline(Sequence):
     """
+    Timeline segments stored as sorted begin/end arrays.
 
-    os.makedirs("traffic_env", exist_ok=True)
+    Indexing and iteration still give {"name", "begin", "end"} dicts, so it can be used wherever a
+    list of segments was. label_at resolves a time step with a cursor, which is O(1) when steps
+    are queried in order (the monitoring loop), and falls back to bisect otherwise.
+    """
 
-    with open(output_path, "w") as routes:
-        print("""<routes>
+    def __init__(self, segments=()):
+        self.names = []
+        self.begins = array("q")
+        self.ends = array("q")
+        for seg in segments:
+            self.append(seg["name"], seg["begin"], seg["end"])
+        self._cursor = 0
+
+    def append(self, name, begin, end):
+        begin = int(begin)
+        end = int(end)
+        if end < begin or (self.ends and begin < self.ends[-1]):
+            raise ValueError(f"Timeline segments must be ordered and disjoint, got [{begin}, {end})")
+        self.names.append(name)
+        self.begins.append(begin)
+        self.ends.append(end)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return {"name": self.names[i], "begin": self.begins[i], "end": self.ends[i]}
+
+    @property
+    def end(self):
+        return self.ends[-1] if self.ends else 0
+
+    def index_at(self, t):
+        """Index of the segment containing time step t, -1 if there is none."""
+        i = self._cursor
+        if i < len(self.names) and self.begins[i] <= t < self.ends[i]:
+            return i
+        # Next segment, the common case when stepping forward
+        i += 1
+        if i < len(self.names) and self.begins[i] <= t < self.ends[i]:
+            self._cursor = i
+            return i
+
+        i = bisect_right(self.begins, t) - 1
+        if i < 0 or t >= self.ends[i]:
+            return -1
+        self._cursor = i
+        return i
+
+    def label_at(self, t, default="Unknown"):
+        i = self.index_at(t)
+        return default if i < 0 else self.names[i]
+
+
+ROUTES_HEADER = """<routes>
     <vType id="standard_car" accel="0.8" decel="4.5" sigma="0.5" length="5" minGap="2.5" maxSpeed="16.67" guiShape="passenger"/>
-""", file=routes)
 
-        # Routes
-        print('    <route id="route_NS" edges="B2A1 A1B4"/>', file=routes)
-        print('    <route id="route_SN" edges="B4A1 A1B2"/>', file=routes)
-        print('    <route id="route_EW" edges="B1A1 A1B3"/>', file=routes)
-        print('    <route id="route_WE" edges="B3A1 A1B1"/>', file=routes)
+    <route id="route_NS" edges="B2A1 A1B4"/>
+    <route id="route_SN" edges="B4A1 A1B2"/>
+    <route id="route_EW" edges="B1A1 A1B3"/>
+    <route id="route_WE" edges="B3A1 A1B1"/>
+"""
 
-        # Timeline flows (each segment gets its own set of 4 flows)
-        for i, seg in enumerate(timeline):
-            name = seg["name"]
-            if name not in SCENARIO_MAP:
-                raise ValueError(f"Unknown segment name: {name}")
-            begin = int(seg["begin"])
-            end = int(seg["end"])
 
-            prob_NS, prob_EW = SCENARIO_MAP[name]
+def segment_flows(i, seg):
+    """The 4 <flow> elements of timeline segment i."""
+    name = seg["name"]
+    if name not in SCENARIO_MAP:
+        raise ValueError(f"Unknown segment name: {name}")
+    begin = int(seg["begin"])
+    end = int(seg["end"])
 
-            print(
-                f'    <flow id="flow_NS_{i}" type="standard_car" route="route_NS" begin="{begin}" end="{end}" probability="{prob_NS}"/>',
-                file=routes)
-            print(
-                f'    <flow id="flow_SN_{i}" type="standard_car" route="route_SN" begin="{begin}" end="{end}" probability="{prob_NS}"/>',
-                file=routes)
-            print(
-                f'    <flow id="flow_EW_{i}" type="standard_car" route="route_EW" begin="{begin}" end="{end}" probability="{prob_EW}"/>',
-                file=routes)
-            print(
-                f'    <flow id="flow_WE_{i}" type="standard_car" route="route_WE" begin="{begin}" end="{end}" probability="{prob_EW}"/>',
-                file=routes)
+    prob_NS, prob_EW = SCENARIO_MAP[name]
 
-        print("</routes>", file=routes)
+    return (
+        f'    <flow id="flow_NS_{i}" type="standard_car" route="route_NS" begin="{begin}" end="{end}" probability="{prob_NS}"/>\n'
+        f'    <flow id="flow_SN_{i}" type="standard_car" route="route_SN" begin="{begin}" end="{end}" probability="{prob_NS}"/>\n'
+        f'    <flow id="flow_EW_{i}" type="standard_car" route="route_EW" begin="{begin}" end="{end}" probability="{prob_EW}"/>\n'
+        f'    <flow id="flow_WE_{i}" type="standard_car" route="route_WE" begin="{begin}" end="{end}" probability="{prob_EW}"/>\n'
+    )
 
-    print(f"--> Generated TIMELINE routes file with {len(timeline)} segments: {output_path}")
 
+def write_timeline_routes(segments, output_path="traffic_env/routes.rou.xml"):
+    """
+    Writes the flows of any iterable of segments (e.g. a lazy timeline) as they come, without holding
+    the timeline in memory. Paths ending in .gz are gzip-compressed, SUMO reads them as they are.
+    Returns the number of segments written.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
 
-def build_random_cycling_timeline(segment_len, n_cycles, seed, t0=0):
+    opener = gzip.open if output_path.endswith(".gz") else open
+    n_segments = 0
+    with opener(output_path, "wt") as routes:
+        routes.write(ROUTES_HEADER)
+
+        # Timeline flows (each segment gets its own set of 4 flows)
+        for i, seg in enumerate(segments):
+            routes.write(segment_flows(i, seg))
+            n_segments += 1
+
+        routes.write("</routes>\n")
+
+    return n_segments
+
+
+def generate_timeline_route_file(timeline, output_path="traffic_env/routes.rou.xml"):
     """
-    Random order of predefined scenarios each cycle, repeats for n_cycles.
-    Total duration = len(scenarios) * segment_len * n_cycles.
+    Writes multiple flows with begin/end windows so traffic changes dynamically over time.
     """
+    n_segments = write_timeline_routes(timeline, output_path)
+
+    print(f"--> Generated TIMELINE routes file with {n_segments} segments: {output_path}")
 
+
+def iter_random_cycling_timeline(segment_len, n_cycles, seed, t0=0):
+    """
+    Lazy form of build_random_cycling_timeline, yields the same segments one at a time.
+    n_cycles=None cycles forever.
+    """
     rng = random.Random(seed)
 
-    timeline = []
     t = int(t0)
-
+    cycle = 0
     last_order = None
-    for _ in range(n_cycles):
+    while n_cycles is None or cycle < n_cycles:
         order = list(SCENARIO_MAP.keys())
         rng.shuffle(order)
 
@@ -76,7 +152,14 @@ def build_random_cycling_timeline(segment_len, n_cycles, seed, t0=0):
         last_order = order
 
         for name in order:
-            timeline.append({"name": name, "begin": t, "end": t + segment_len})
+            yield {"name": name, "begin": t, "end": t + segment_len}
             t += segment_len
+        cycle += 1
+
 
-    return timeline
+def build_random_cycling_timeline(segment_len, n_cycles, seed, t0=0):
+    """
+    Random order of predefined scenarios each cycle, repeats for n_cycles.
+    Total duration = len(scenarios) * segment_len * n_cycles.
+    """
+    return Timeline(iter_random_cycling_timeline(segment_len, n_cycles, seed, t0))
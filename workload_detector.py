@@ -0,0 +1,299 @@
+import numpy as np
+
+###### Global definitions of configurable parameters
+### Classification thresholds
+QUEUE_THRESHOLD = 10
+FLOW_RATIO_THRESHOLD = 2.0
+###
+### Stream smoothing and stability
+# Steps averaged before classifying, 1 classifies every raw snapshot
+DETECTOR_WINDOW = 5
+# Consecutive identical classifications needed before a new workload is reported as stable
+MIN_STABLE_CLASSIFICATIONS = 6
+# Below this many halted cars the current workload is kept, whatever the classification says
+MIN_HALTED_CARS = 6
+###
+### Adaptation triggers
+TRIGGER_POLICIES = ("periodic", "change_point")
+# Periodic policy: steps between two checks for a new workload
+CHECK_EVERY = 25
+# Change-point policy (Page-Hinkley on the series averaged over one signal cycle, so the queue build-up and
+# discharge within a cycle is not taken for a change): per-step drift tolerated, cumulative drift that raises
+# an event, and steps an event waits for the detector to ask for an adaptation (once it does, the trigger
+# stays armed until the adaptation need clears)
+CHANGE_POINT_DELTA = 1.0
+CHANGE_POINT_THRESHOLD = 60.0
+CHANGE_POINT_HOLD = 2 * MIN_STABLE_CLASSIFICATIONS + DETECTOR_WINDOW
+# Signal cycle in steps until the first plan is reported (two 42 s greens and two 3 s yellows of cross.net.xml)
+DEFAULT_CYCLE_LENGTH = 90
+######
+
+# Label codes used by the vectorized classifier, in classification priority order
+WORKLOAD_LABELS = ("Saturated", "NS_Heavy", "EW_Heavy", "NS_Flow", "EW_Flow", "High_Volume_Balanced",
+                   "Light_Balanced")
+NO_WORKLOAD = -1
+
+# Series watched by the change-point trigger
+CHANGE_POINT_SERIES = ("ns_queue", "ew_queue", "ns_volume", "ew_volume")
+
+
+def classify_batch(halting_states, density_states, queue_threshold=QUEUE_THRESHOLD,
+                   flow_ratio_threshold=FLOW_RATIO_THRESHOLD):
+    """
+    Classifies many intersections at once, with the same rules as main.classify_workload.
+
+    halting_states: (n, 4) stopped cars per incoming lane [NS1, NS2, EW1, EW2].
+    density_states: (n, 4) total cars per incoming lane, same order.
+    Returns (codes, ratios, ns_values, ew_values); codes index WORKLOAD_LABELS and the values are
+    queues, or volumes for the flow workloads.
+    """
+    halting = np.asarray(halting_states, dtype=float).reshape(-1, 4)
+    density = np.asarray(density_states, dtype=float).reshape(-1, 4)
+
+    ns_queue = halting[:, 0] + halting[:, 1]
+    ew_queue = halting[:, 2] + halting[:, 3]
+    ns_volume = density[:, 0] + density[:, 1]
+    ew_volume = density[:, 2] + density[:, 3]
+
+    ns_is_critical = ns_queue > queue_threshold
+    ew_is_critical = ew_queue > queue_threshold
+    saturated = (ns_is_critical & ew_is_critical) | (ns_is_critical & (ew_volume > queue_threshold)) | \
+                (ew_is_critical & (ns_volume > queue_threshold))
+    high_flow = (ns_volume > queue_threshold) | (ew_volume > queue_threshold)
+
+    vol_ratio = ns_volume / np.maximum(1, ew_volume)
+    inverse_vol_ratio = np.divide(1.0, vol_ratio, out=np.ones_like(vol_ratio), where=vol_ratio != 0)
+
+    conditions = [saturated, ns_is_critical, ew_is_critical, high_flow & (vol_ratio >= flow_ratio_threshold),
+                  high_flow & (vol_ratio <= 1 / flow_ratio_threshold), high_flow]
+    codes = np.select(conditions, np.arange(len(conditions)), default=len(conditions))
+    ratios = np.select(conditions, [np.ones_like(vol_ratio), ns_queue / np.maximum(1, ew_queue),
+                                    ew_queue / np.maximum(1, ns_queue), vol_ratio, inverse_vol_ratio,
+                                    np.ones_like(vol_ratio)], default=1.0)
+
+    # Flow workloads are described by their volumes, all others by their queues
+    by_volume = high_flow & ~saturated & ~ns_is_critical & ~ew_is_critical
+    ns_values = np.where(by_volume, ns_volume, ns_queue)
+    ew_values = np.where(by_volume, ew_volume, ew_queue)
+
+    return codes, ratios, ns_values, ew_values
+
+
+class WorkloadDetector:
+    """
+    Streaming workload detection for one or more intersections.
+
+    Every step the latest halting/density snapshots go into a ring buffer of `window` steps, the
+    windowed means are classified in one vectorized call, and per-stream stability counters decide
+    when a new workload is trustworthy enough to adapt to.
+    """
+
+    def __init__(self, n_streams=1, window=DETECTOR_WINDOW, min_stable=MIN_STABLE_CLASSIFICATIONS,
+                 min_halted=MIN_HALTED_CARS, queue_threshold=QUEUE_THRESHOLD,
+                 flow_ratio_threshold=FLOW_RATIO_THRESHOLD):
+        self.n_streams = n_streams
+        self.window = window
+        self.min_stable = min_stable
+        self.min_halted = min_halted
+        self.queue_threshold = queue_threshold
+        self.flow_ratio_threshold = flow_ratio_threshold
+
+        self._halting = np.zeros((n_streams, window, 4))
+        self._density = np.zeros((n_streams, window, 4))
+        self._pos = 0
+        self._filled = 0
+
+        # Per stream: last detection, workload being confirmed, its stability count and the applied workload
+        self.detected = np.full(n_streams, NO_WORKLOAD)
+        self.candidate = np.full(n_streams, NO_WORKLOAD)
+        self.stable = np.zeros(n_streams, dtype=int)
+        self.current = np.full(n_streams, NO_WORKLOAD)
+
+    def features(self):
+        """Windowed mean halting and density states, shape (n_streams, 4) each."""
+        if self._filled == 0:
+            return np.zeros((self.n_streams, 4)), np.zeros((self.n_streams, 4))
+        return self._halting[:, :self._filled].mean(axis=1), self._density[:, :self._filled].mean(axis=1)
+
+    def update(self, halting_states, density_states):
+        """
+        Consumes one snapshot per stream (arrays of shape (n_streams, 4)) and returns the detected
+        workload codes. A stream with fewer than min_halted stopped cars keeps its current workload.
+        """
+        self._halting[:, self._pos] = np.asarray(halting_states, dtype=float).reshape(self.n_streams, 4)
+        self._density[:, self._pos] = np.asarray(density_states, dtype=float).reshape(self.n_streams, 4)
+        self._pos = (self._pos + 1) % self.window
+        self._filled = min(self._filled + 1, self.window)
+
+        halting, density = self.features()
+        codes, _, _, _ = classify_batch(halting, density, self.queue_threshold, self.flow_ratio_threshold)
+
+        too_few_halted = (halting.sum(axis=1) < self.min_halted) & (self.current != NO_WORKLOAD)
+        codes = np.where(too_few_halted, self.current, codes)
+
+        changed = codes != self.candidate
+        self.stable = np.where(changed, 1, self.stable + 1)
+        self.candidate = codes
+        self.detected = codes
+        return codes
+
+    def should_adapt(self):
+        """Streams whose stable candidate differs from the applied workload."""
+        return (self.stable >= self.min_stable) & (self.candidate != self.current)
+
+    def confirm(self, label, stream=0):
+        """Marks a workload as applied on a stream."""
+        self.current[stream] = WORKLOAD_LABELS.index(label)
+
+    def reset(self):
+        self._pos = 0
+        self._filled = 0
+        self.detected[:] = NO_WORKLOAD
+        self.candidate[:] = NO_WORKLOAD
+        self.stable[:] = 0
+        self.current[:] = NO_WORKLOAD
+
+    @staticmethod
+    def label(code):
+        return None if code == NO_WORKLOAD else WORKLOAD_LABELS[code]
+
+
+def state_series(halting_state, density_state):
+    """NS/EW queue and volume of one snapshot, in CHANGE_POINT_SERIES order."""
+    halting = np.asarray(halting_state, dtype=float)
+    density = np.asarray(density_state, dtype=float)
+    return np.array([halting[0] + halting[1], halting[2] + halting[3], density[0] + density[1],
+                     density[2] + density[3]])
+
+
+class PeriodicTrigger:
+    """Looks for a new workload every check_every steps."""
+
+    def __init__(self, check_every=CHECK_EVERY):
+        self.check_every = check_every
+        self.events = []
+
+    def update(self, t, halting_state, density_state, adapt_needed):
+        return t % self.check_every == 0
+
+    def restart(self, cycle_length=None):
+        pass
+
+    def record_adaptation(self, t):
+        pass
+
+    def latencies(self):
+        return []
+
+
+class ChangePointTrigger:
+    """
+    Two-sided Page-Hinkley test on the queue and volume series, averaged over the last signal cycle.
+    When the cumulative deviation of any averaged series from its running mean exceeds threshold
+    (after subtracting delta per step), a change event is recorded and the averages and statistics
+    restart. An event arms the trigger: if the detector asks for an adaptation within `hold` steps,
+    the trigger stays armed until that need clears (the new workload was applied, or the detector
+    went back to the current one), so a change arriving while an adaptation is pending, or after a
+    stale result was discarded, is still acted on. During the first cycle after a restart (a new plan)
+    no change can be seen yet, so a stable detection arms the trigger directly.
+
+    Events: {"t", "series", "statistic", "adapted_at"}; record_adaptation() fills in "adapted_at".
+    """
+
+    def __init__(self, delta=CHANGE_POINT_DELTA, threshold=CHANGE_POINT_THRESHOLD, hold=CHANGE_POINT_HOLD,
+                 cycle_length=DEFAULT_CYCLE_LENGTH):
+        self.delta = delta
+        self.threshold = threshold
+        self.hold = hold
+        self.events = []
+        # Armed until the first adaptation, before it there is no workload to stay on
+        self._armed = True
+        self._armed_until = np.inf
+        self._confirmed = False
+        self.restart(cycle_length)
+
+    def restart(self, cycle_length=None):
+        """Forgets the averages and statistics, e.g. after a new plan changed the queues and the cycle length."""
+        if cycle_length is not None:
+            self.cycle_length = int(cycle_length)
+        n_series = len(CHANGE_POINT_SERIES)
+        self._cycle = np.zeros((self.cycle_length, n_series))
+        self._cycle_sum = np.zeros(n_series)
+        self._pos = 0
+        self._filled = 0
+        self._reset_statistics()
+
+    def _reset_statistics(self):
+        n_series = len(CHANGE_POINT_SERIES)
+        self._n = 0
+        self._mean = np.zeros(n_series)
+        self._up = np.zeros(n_series)
+        self._up_min = np.zeros(n_series)
+        self._down = np.zeros(n_series)
+        self._down_max = np.zeros(n_series)
+
+    def _cycle_average(self, x):
+        """Mean of the series over the last cycle, None until a whole cycle was seen."""
+        self._cycle_sum += x - self._cycle[self._pos]
+        self._cycle[self._pos] = x
+        self._pos = (self._pos + 1) % self.cycle_length
+        self._filled = min(self._filled + 1, self.cycle_length)
+        if self._filled < self.cycle_length:
+            return None
+        return self._cycle_sum / self.cycle_length
+
+    def update(self, t, halting_state, density_state, adapt_needed):
+        """
+        Feeds one snapshot and whether the detector currently asks for an adaptation. Returns True
+        while a detected change still waits for an adaptation.
+        """
+        x = self._cycle_average(state_series(halting_state, density_state))
+
+        if x is not None:
+            self._n += 1
+            self._mean += (x - self._mean) / self._n
+            self._up += x - self._mean - self.delta
+            self._up_min = np.minimum(self._up_min, self._up)
+            self._down += x - self._mean + self.delta
+            self._down_max = np.maximum(self._down_max, self._down)
+
+            statistic = np.maximum(self._up - self._up_min, self._down_max - self._down)
+            changed = statistic > self.threshold
+            if changed.any():
+                self.events.append({"t": t, "series": [CHANGE_POINT_SERIES[i] for i in np.flatnonzero(changed)],
+                                    "statistic": float(statistic.max()), "adapted_at": None})
+                # The averages still hold the old regime, start over from the new one
+                self.restart()
+                self._armed = True
+                self._armed_until = t + self.hold
+                self._confirmed = False
+
+        # Right after a restart the averages cannot show a change yet, a stable detection is trusted meanwhile
+        if x is None and adapt_needed and not self._armed:
+            self._armed = True
+            self._armed_until = t
+
+        if self._armed:
+            if adapt_needed:
+                self._confirmed = True
+            elif self._confirmed or t > self._armed_until:
+                self._armed = False
+
+        return self._armed
+
+    def record_adaptation(self, t):
+        """An adaptation was started for the pending change."""
+        if self.events and self.events[-1]["adapted_at"] is None:
+            self.events[-1]["adapted_at"] = t
+
+    def latencies(self):
+        """Steps between each change event and the adaptation it triggered."""
+        return [event["adapted_at"] - event["t"] for event in self.events if event["adapted_at"] is not None]
+
+
+def build_trigger(policy, check_every=CHECK_EVERY):
+    if policy not in TRIGGER_POLICIES:
+        raise ValueError(f"Unknown trigger policy: {policy}")
+    if policy == "periodic":
+        return PeriodicTrigger(check_every)
+    return ChangePointTrigger()